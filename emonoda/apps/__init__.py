@@ -294,6 +294,10 @@ def _get_config_scheme() -> Dict:
             "torrents_dir":  Option(default=".", type=as_path, help="Path to directory with torrent files"),
             "data_root_dir": Option(default="~/Downloads", type=as_path_or_empty, help="Path to root directory with data of torrents"),
             "another_data_root_dirs": Option(default=[], type=as_paths_list, help="Paths to another data directories"),
+            "load_workers":  Option(default=0, help="The number of processes to load torrent files (0 - by the number of CPUs)"),
+            "load_threads":  Option(default=False, help="Use the threads instead of the processes to load torrent files"),
+            "torrents_index_file": Option(default="~/.cache/emonoda-torrents.db", type=as_path_or_empty,
+                                          help="Index of the parsed torrent files to skip the unchanged ones (empty - disabled)"),
             "use_colors":    Option(default=True, help="Enable colored output"),
             "force_colors":  Option(default=False, help="Always use the coloring"),
         },
@@ -308,6 +312,7 @@ def _get_config_scheme() -> Dict:
             "show_passed":   Option(default=False, help="Show the torrents without changes"),
             "show_diff":     Option(default=True, help="Show diff between old and updated torrent files"),
             "fail_bad_tracker": Option(default=True, help="Fail on trackers with invalid configuration"),
+            "lookahead":     Option(default=100, help="The number of torrents to check ahead of the output"),
         },
 
         "emstat": {
@@ -327,9 +332,18 @@ def _get_config_scheme() -> Dict:
         },
 
         "emfind": {
-            "cache_file":  Option(default="~/.cache/emfind.pk", type=as_path, help="Torrents cache"),
+            "cache_file":  Option(default="~/.cache/emfind.db", type=as_path, help="Torrents cache (SQLite database)"),
             "name_filter": Option(default="*.torrent", help="Cache only filtered torrent files"),
             "files_from_client": Option(default=False, help="Fetch torrent file entries from a client instead of torrent files"),
+            "update_cache": Option(default=True, help="Sync the cache with client before the query (disable if the hooks do it)"),
             "ignore_orphans": Option(default=[], type=as_paths_list, help="Ignore these paths on the final analyse"),
+            "scan_workers": Option(default=8, help="The number of threads to scan the data roots concurrently"),
+            "snapshot_file": Option(default="", type=as_path_or_empty,
+                                    help="Snapshot of the data roots to skip the unchanged directories (empty - disabled)"),
+        },
+
+        "emverify": {
+            "workers":    Option(default=0, help="The number of threads to hash the data (0 - by the number of CPUs)"),
+            "chunk_size": Option(default=64 * 1024 * 1024, help="The size of data verified by one task of a worker"),
         },
     }
@@ -18,7 +18,6 @@
 
 
 import sys
-import os
 import shlex
 import itertools
 import argparse
@@ -139,16 +138,7 @@ def _make_formatted_tree(files: Dict, _depth: int=0, _prefix: str="    ") -> str
 
 
 def format_files_tree(torrent: Torrent) -> str:
-    tree: Dict = {}
-    for path in torrent.get_files():
-        parts = os.path.normpath(path).split(os.path.sep)
-        local = tree
-        for (index, part) in enumerate(parts):
-            if index != 0 and len(part) == 0:
-                continue
-            local.setdefault(part, {})
-            local = local[part]
-    return _make_formatted_tree(tree)
+    return _make_formatted_tree(torrent.get_files().get_nested())
 
 
 def print_pretty_all(torrent: Torrent, client: Optional[BaseClient], customs: List[str], log: Log) -> None:
@@ -19,17 +19,40 @@
 
 import sys
 import os
+import stat
+import json
+import heapq
+import operator
+import itertools
+import functools
+import hashlib
+import concurrent.futures
 import argparse
 
+from typing import Tuple
 from typing import List
+from typing import Set
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Generator
+from typing import Optional
+from typing import TextIO
+from typing import ContextManager
+from typing import Any
 
 from ..plugins.clients import BaseClient
 
 from ..helpers import tcollection
 from ..helpers import datacache
+from ..helpers import datascan
+from ..helpers import datapieces
 
+from ..tfile import Torrent
 from ..tfile import TorrentEntryAttrs
+from ..tfile import TorrentsDiff
+from ..tfile import get_torrents_difference
+from ..tfile import is_pad_file_path
 
 from ..cli import Log
 
@@ -43,173 +66,537 @@ from . import get_configured_client
 
 
 # =====
-def build_used_files(cache: datacache.TorrentsCache, data_roots: List[str]) -> Dict[str, TorrentEntryAttrs]:
-    files: Dict[str, TorrentEntryAttrs] = dict.fromkeys(data_roots, TorrentEntryAttrs.dir())
-    for c_attrs in cache.torrents.values():
-        prefix = os.path.normpath(c_attrs.prefix)
+class Report:
+    # Writes the records as JSON lines when the output is passed, or as text via Log
 
-        for (path, f_attrs) in c_attrs.files.items():
-            files[os.path.join(prefix, path)] = f_attrs
+    def __init__(self, log: Log, json_output: Optional[TextIO]) -> None:
+        self.__log = log
+        self.__json_output = json_output
 
+    def write(self, record: Dict[str, Any], *lines: Tuple[str, Tuple]) -> None:
+        if self.__json_output is not None:
+            self.__json_output.write(json.dumps(record) + "\n")
+        else:
+            for (text, placeholders) in lines:
+                self.__log.print(text, placeholders)
+
+
+# =====
+def iter_used_files(
+    cache: datacache.TorrentsCache,
+    data_roots: List[str],
+) -> Iterator[Tuple[str, TorrentEntryAttrs]]:
+
+    # The data roots and the directories between them and the prefixes of torrents are used too.
+    # There are not so many prefixes, so only they are collected in memory.
+    dirs: Set[str] = set(data_roots)
+    for prefix in cache.get_prefixes():
         for data_root_path in data_roots:
             if prefix.startswith(data_root_path):
                 parts: List[str] = list(filter(None, prefix[len(data_root_path):].split(os.path.sep)))
                 for index in range(len(parts)):
-                    path = os.path.join(*([data_root_path] + parts[:index + 1]))
-                    files[path] = TorrentEntryAttrs.dir()
+                    dirs.add(os.path.join(*([data_root_path] + parts[:index + 1])))
                 break
-    return files
+    return heapq.merge(
+        ((path, TorrentEntryAttrs.dir()) for path in tools.sorted_paths(dirs)),
+        cache.iter_files_sorted(),
+        key=_get_path_key,
+    )
 
 
-def build_all_files(data_root_path: str, log: Log) -> Dict[str, TorrentEntryAttrs]:
-    if not log.isatty():
-        log.info("Scanning directory {cyan}%s{reset} ...", (data_root_path,))
+def iter_orphaned_files(
+    all_files: Iterable[Tuple[str, TorrentEntryAttrs]],
+    used_files: Iterable[Tuple[str, TorrentEntryAttrs]],
+) -> Generator[Tuple[str, TorrentEntryAttrs], None, None]:
+
+    # Both streams are in the order of tools.sorted_paths()
+    used_keys = map(_get_path_key, used_files)
+    used_key: Optional[str] = next(used_keys, None)
+    for item in all_files:
+        key = _get_path_key(item)
+        while used_key is not None and used_key < key:
+            used_key = next(used_keys, None)
+        if used_key != key:
+            yield item
 
-    files: Dict[str, TorrentEntryAttrs] = {}
-    for (prefix, _, local_files) in log.progress(
-        os.walk(data_root_path),
-        ("Scanning directory {cyan}%s{reset} ...", (data_root_path,)),
-        ("Scanned directory {cyan}%s{reset}", (data_root_path,))
-    ):
-        files[tools.get_decoded_path(prefix)] = TorrentEntryAttrs.dir()
-        for name in local_files:
-            path = os.path.join(prefix, name)
-            try:
-                size = os.path.getsize(path)
-            except FileNotFoundError:
-                continue
-            files[tools.get_decoded_path(path)] = TorrentEntryAttrs.file(size)
 
-    if not log.isatty():
-        log.info("Scanned directory {cyan}%s{reset}", (data_root_path,))
-    return files
+def _get_path_key(item: Tuple[str, TorrentEntryAttrs]) -> str:
+    return item[0].replace(os.path.sep, "\0")
 
 
 # =====
-def print_orphaned_files(  # pylint: disable=too-many-locals,too-many-positional-arguments
+def print_orphaned_files(  # pylint: disable=too-many-positional-arguments
     cache: datacache.TorrentsCache,
     data_roots: List[str],
     ignore_orphans: List[str],
     reduce_dirs: bool,
-    log_stdout: Log,
+    scan_workers: int,
+    snapshot_path: str,
+    report: Report,
     log_stderr: Log,
 ) -> None:
 
-    all_files = {}
-    for data_root_path in data_roots:
-        all_files.update(build_all_files(data_root_path, log_stderr))
-
-    log_stderr.info("Transposing the cache: by-hashes -> files ...")
-    used_files = build_used_files(cache, data_roots)
-
-    files = set(all_files).difference(used_files)
-    for path in list(files):
-        for ignored_path in ignore_orphans:
-            if path == ignored_path or path.startswith(ignored_path + os.path.sep):
-                files.remove(path)
-                break
+    count = 0
+    size = 0
+    common_root = "\0"
+    for (path, attrs) in iter_orphaned_files(
+        all_files=datascan.iter_data_roots(data_roots, scan_workers, log_stderr, snapshot_path),
+        used_files=iter_used_files(cache, data_roots),
+    ):
+        if any(path == ignored_path or path.startswith(ignored_path + os.path.sep) for ignored_path in ignore_orphans):
+            continue
+
+        if count == 0:
+            log_stderr.info("Orhpaned files:")
+        count += 1
+        size += attrs.size
+        if reduce_dirs:
+            if path.startswith(common_root + os.path.sep):  # pylint: disable=no-else-continue
+                continue
+            else:
+                common_root = (path if attrs.is_dir else "\0")
+        line = ("{blue}D" if attrs.is_dir else "{magenta}F") + "{reset} %s"
+        report.write({"path": path, "is_dir": attrs.is_dir, "size": attrs.size}, (line, (path,)))
 
-    if len(files) != 0:
-        log_stderr.info("Orhpaned files:")
-        size = 0
-        common_root = "\0"
-        for path in tools.sorted_paths(files):
-            size += all_files[path].size
-            if reduce_dirs:
-                if path.startswith(common_root + os.path.sep):  # pylint: disable=no-else-continue
-                    continue
-                else:
-                    common_root = (path if all_files[path].is_dir else "\0")
-            line = ("{blue}D" if all_files[path].is_dir else "{magenta}F") + "{reset} %s"
-            log_stdout.print(line, (path,))
+    if count != 0:
         log_stderr.info("Found {red}%d{reset} orphaned files = {red}%s{reset}",
-                        (len(files), fmt.format_size(size)))
+                        (count, fmt.format_size(size)))
     else:
         log_stderr.info("No orphaned files found")
 
 
-def print_not_in_client(
+def print_not_in_client(  # pylint: disable=too-many-positional-arguments
     client: BaseClient,
     torrents_dir_path: str,
     name_filter: str,
-    log_stdout: Log,
+    load_workers: int,
+    load_threads: bool,
+    index_path: str,
+    report: Report,
     log_stderr: Log,
 ) -> None:
 
-    torrents = tcollection.by_hash(tcollection.load_from_dir(
+    log_stderr.info("Fetching all hashes from client ...")
+    client_hashes = set(client.get_hashes())
+
+    # The torrents are reported as soon as they are loaded
+    not_in_client: Set[str] = set()
+    for (_, torrent) in tcollection.iter_from_dir(
         path=torrents_dir_path,
         name_filter=name_filter,
         precalculate_hashes=True,
         log=log_stderr,
-    ))
-
-    log_stderr.info("Fetching all hashes from client ...")
-    client_hashes = client.get_hashes()
+        workers=load_workers,
+        use_threads=load_threads,
+        index_path=index_path,
+    ):
+        if torrent is not None:
+            torrent_hash = torrent.get_hash()
+            if torrent_hash not in client_hashes and torrent_hash not in not_in_client:
+                if len(not_in_client) == 0:
+                    log_stderr.info("Not in client:")
+                not_in_client.add(torrent_hash)
+                report.write({"path": torrent.get_path(), "hash": torrent_hash}, ("%s", (torrent.get_path(),)))
 
-    not_in_client = set(torrents).difference(client_hashes)
     if len(not_in_client) != 0:
-        log_stderr.info("Not in client:")
-        for torrent_hash in not_in_client:
-            log_stdout.print("%s", (torrents[torrent_hash].get_path(),))
         log_stderr.info("Found {red}%d{reset} unregistered torrents", (len(not_in_client),))
     else:
         log_stderr.info("No unregistered files found")
 
 
-def print_missing_torrents(
+def print_missing_torrents(  # pylint: disable=too-many-positional-arguments
     client: BaseClient,
     torrents_dir_path: str,
     name_filter: str,
-    log_stdout: Log,
+    load_workers: int,
+    load_threads: bool,
+    index_path: str,
+    report: Report,
     log_stderr: Log,
 ) -> None:
 
-    torrents = tcollection.by_hash(tcollection.load_from_dir(
-        path=torrents_dir_path,
-        name_filter=name_filter,
-        precalculate_hashes=True,
-        log=log_stderr,
-    ))
+    hashes = set(
+        torrent.get_hash()
+        for (_, torrent) in tcollection.iter_from_dir(
+            path=torrents_dir_path,
+            name_filter=name_filter,
+            precalculate_hashes=True,
+            log=log_stderr,
+            workers=load_workers,
+            use_threads=load_threads,
+            index_path=index_path,
+            with_progress=True,
+        )
+        if torrent is not None
+    )
 
     log_stderr.info("Fetching all hashes from client ...")
     client_hashes = client.get_hashes()
 
-    missing_torrents = set(client_hashes).difference(torrents)
+    missing_torrents = set(client_hashes).difference(hashes)
     if len(missing_torrents) != 0:
         log_stderr.info("Missing torrents for:")
         for torrent_hash in missing_torrents:
-            log_stdout.print("%s -- %s", (torrent_hash, client.get_file_name(torrent_hash)))
+            name = client.get_file_name(torrent_hash)
+            report.write({"hash": torrent_hash, "name": name}, ("%s -- %s", (torrent_hash, name)))
         log_stderr.info("Found {red}%d{reset} torrents without torrent-files", (len(missing_torrents),))
     else:
         log_stderr.info("No torrents without torrent-files found")
 
 
-def print_duplicate_torrents(
+def print_duplicate_torrents(  # pylint: disable=too-many-positional-arguments
     torrents_dir_path: str,
     name_filter: str,
-    log_stdout: Log,
+    load_workers: int,
+    load_threads: bool,
+    index_path: str,
+    report: Report,
     log_stderr: Log,
 ) -> None:
 
     torrents = {
         torrent_hash: variants
-        for (torrent_hash, variants) in tcollection.by_hash_with_dups(tcollection.load_from_dir(
+        for (torrent_hash, variants) in tcollection.by_hash_with_dups(tcollection.iter_from_dir(
             path=torrents_dir_path,
             name_filter=name_filter,
             precalculate_hashes=True,
             log=log_stderr,
+            workers=load_workers,
+            use_threads=load_threads,
+            index_path=index_path,
+            with_progress=True,
         )).items()
         if len(variants) > 1
     }
     if len(torrents) != 0:
         for (torrent_hash, variants) in torrents.items():
-            log_stdout.print(torrent_hash)
-            for torrent in variants:
-                log_stdout.print("\t%s", (torrent.get_path(),))
+            paths = [torrent.get_path() for torrent in variants]
+            report.write({"hash": torrent_hash, "paths": paths}, ("%s", (torrent_hash,)), *(("\t%s", (path,)) for path in paths))
     else:
         log_stderr.info("No duplicate torrents found")
 
 
+def load_not_in_client(  # pylint: disable=too-many-positional-arguments
+    client: BaseClient,
+    torrents_dir_path: str,
+    name_filter: str,
+    load_workers: int,
+    load_threads: bool,
+    index_path: str,
+    log: Log,
+) -> List[Torrent]:
+
+    client_hashes = set(client.get_hashes())
+    return [
+        Torrent(path=torrent.get_path())  # The loaders drop the pieces, they are needed here
+        for (_, torrent) in tcollection.iter_from_dir(
+            path=torrents_dir_path,
+            name_filter=name_filter,
+            precalculate_hashes=True,
+            log=log,
+            workers=load_workers,
+            use_threads=load_threads,
+            index_path=index_path,
+            with_progress=True,
+        )
+        if torrent is not None and torrent.get_hash() not in client_hashes
+    ]
+
+
+def match_data(  # pylint: disable=too-many-positional-arguments,too-many-locals
+    client: Optional[BaseClient],
+    torrents: List[Torrent],
+    data_roots: List[str],
+    scan_workers: int,
+    snapshot_path: str,
+    samples: int,
+    report: Report,
+    log_stderr: Log,
+) -> None:
+
+    # The found prefixes are applied to client if it's passed.
+    # The largest file of each torrent is its anchor. Only the files of the anchor sizes are indexed,
+    # the candidate prefixes are checked by the sizes of all files and then by the sampled pieces.
+    anchors: Dict[str, datapieces.DataFile] = {}
+    for torrent in torrents:
+        files = [data_file for data_file in datapieces.get_data_files(torrent, "") if data_file.size > 0 and not data_file.pad]
+        if len(files) != 0:
+            anchors[torrent.get_path()] = max(files, key=operator.attrgetter("size"))
+    sizes = {anchor.size for anchor in anchors.values()}
+
+    index: Dict[int, List[str]] = {}
+    for (path, attrs) in datascan.iter_data_roots(data_roots, scan_workers, log_stderr, snapshot_path):
+        if not attrs.is_dir and attrs.size in sizes:
+            index.setdefault(attrs.size, []).append(path)
+
+    found = 0
+    for torrent in torrents:
+        anchor = anchors.get(torrent.get_path())
+        if anchor is None:
+            continue
+        for path in index.get(anchor.size, []):
+            if not path.endswith(os.path.sep + anchor.path):
+                continue
+            prefix = path[:-len(anchor.path) - 1]
+            if _check_files_sizes(torrent, prefix) and datapieces.check_sampled_pieces(torrent, prefix, samples):
+                report.write({"path": torrent.get_path(), "prefix": prefix}, ("%s -- %s", (torrent.get_path(), prefix)))
+                found += 1
+                if client is not None:
+                    if client.has_torrent(torrent):
+                        log_stderr.info("Already in client: {cyan}%s{reset}", (torrent.get_path(),))
+                    else:
+                        client.load_torrent(torrent, prefix)
+                        log_stderr.info("Loaded to client: {cyan}%s{reset}", (torrent.get_path(),))
+                break
+
+    log_stderr.info("Found data for {magenta}%d{reset} of {yellow}%d{reset} torrents", (found, len(torrents)))
+
+
+def _check_files_sizes(torrent: Torrent, prefix: str) -> bool:
+    for data_file in datapieces.get_data_files(torrent, prefix):
+        if data_file.pad:
+            continue
+        try:
+            if os.stat(data_file.path).st_size != data_file.size:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+_DUPLICATES_BATCH = 64  # Groups of the same size hashed by the pool at once
+_PARTIAL_HASH_SIZE = 64 * 1024
+
+
+def iter_duplicate_files(
+    cache: datacache.TorrentsCache,
+    min_size: int,
+    workers: int,
+    log: Log,
+) -> Generator[Tuple[int, List[str]], None, None]:
+
+    # The files with the same size from the cache are compared by the hashes of the first block
+    # and then by the full hashes. The already hardlinked files are counted once.
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as executor:
+        groups = cache.iter_same_size_files(min_size)
+        while True:
+            batch = [
+                (size, paths)
+                for (size, paths) in map(_get_distinct_files, itertools.islice(groups, _DUPLICATES_BATCH))
+                if len(paths) > 1
+            ]
+            if len(batch) == 0:
+                break
+            log.info("Hashing {yellow}%d{reset} files of the same sizes ...", (sum(len(paths) for (_, paths) in batch),))
+            batch = _split_by_hashes(executor, batch, _PARTIAL_HASH_SIZE)
+            batch = _split_by_hashes(executor, batch, None)
+            yield from batch
+
+
+def _get_distinct_files(group: Tuple[int, List[str]]) -> Tuple[int, List[str]]:
+    (size, paths) = group
+    inodes: Dict[Tuple[int, int], str] = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if st.st_size == size:
+            inodes.setdefault((st.st_dev, st.st_ino), path)
+    return (size, sorted(inodes.values()))
+
+
+def _split_by_hashes(
+    executor: concurrent.futures.Executor,
+    batch: List[Tuple[int, List[str]]],
+    limit: Optional[int],
+) -> List[Tuple[int, List[str]]]:
+
+    paths = [path for (size, group) in batch if limit is None or size > limit for path in group]
+    hashes = dict(zip(paths, executor.map(functools.partial(_hash_file, limit=limit), paths)))
+    result: List[Tuple[int, List[str]]] = []
+    for (size, group) in batch:
+        if limit is not None and size <= limit:
+            result.append((size, group))  # The partial hash is the full one, so the next stage does it
+            continue
+        by_hash: Dict[bytes, List[str]] = {}
+        for path in group:
+            file_hash = hashes[path]
+            if file_hash is not None:
+                by_hash.setdefault(file_hash, []).append(path)
+        result.extend((size, same) for same in by_hash.values() if len(same) > 1)
+    return result
+
+
+def _hash_file(path: str, limit: Optional[int]) -> Optional[bytes]:
+    file_hash = hashlib.sha1()
+    left = limit
+    try:
+        with open(path, "rb") as file_obj:
+            while left is None or left > 0:
+                data = file_obj.read(1024 * 1024 if left is None else min(left, 1024 * 1024))
+                if not data:
+                    break
+                file_hash.update(data)
+                if left is not None:
+                    left -= len(data)
+    except OSError:
+        return None
+    return file_hash.digest()
+
+
+def print_duplicate_files(  # pylint: disable=too-many-positional-arguments
+    cache: datacache.TorrentsCache,
+    min_size: int,
+    workers: int,
+    hardlink: bool,
+    report: Report,
+    log_stderr: Log,
+) -> None:
+
+    count = 0
+    reclaimable = 0
+    for (size, paths) in iter_duplicate_files(cache, min_size, workers, log_stderr):
+        count += 1
+        reclaimable += size * (len(paths) - 1)
+        report.write(
+            {"size": size, "paths": paths},
+            ("{magenta}%s{reset} x %d", (fmt.format_size(size), len(paths))),
+            *(("\t%s", (path,)) for path in paths),
+        )
+        if hardlink:
+            _replace_by_hardlinks(paths, log_stderr)
+
+    if count != 0:
+        log_stderr.info("Found {red}%d{reset} sets of duplicate files, reclaimable {red}%s{reset}%s",
+                        (count, fmt.format_size(reclaimable), (" (hardlinked)" if hardlink else "")))
+    else:
+        log_stderr.info("No duplicate files found")
+
+
+def _replace_by_hardlinks(paths: List[str], log: Log) -> None:
+    # The first safe file is kept, the other safe ones are replaced atomically.
+    # The incomplete downloads may have the same hashes only because of the unwritten zeros,
+    # so after the hardlinking the client would write the pieces of one torrent to the data of another.
+    safe: List[Tuple[str, int]] = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            if _is_maybe_incomplete(path, st):
+                log.error("Won't hardlink the sparse or zero-filled file: {red}%s{reset}", (path,))
+            else:
+                safe.append((path, st.st_dev))
+        except OSError as err:
+            log.error("Can't hardlink {red}%s{reset}: %s", (path, err))
+
+    if len(safe) < 2:
+        return
+    (master, master_dev) = safe[0]
+    for (path, dev) in safe[1:]:
+        if dev != master_dev:
+            log.error("Can't hardlink across the filesystems: {red}%s{reset}", (path,))
+            continue
+        tmp_path = tools.make_sub_name(path, ".", ".emfind-link")
+        try:
+            os.link(master, tmp_path)
+        except OSError as err:
+            log.error("Can't hardlink {red}%s{reset}: %s", (path, err))
+            continue
+        try:
+            os.replace(tmp_path, path)
+        except OSError as err:
+            log.error("Can't hardlink {red}%s{reset}: %s", (path, err))
+            os.unlink(tmp_path)
+
+
+def _is_maybe_incomplete(path: str, st: os.stat_result) -> bool:
+    # The holes of the sparse files and the preallocated blocks are read as zeros
+    if st.st_blocks * 512 < st.st_size:
+        return True
+    with open(path, "rb") as file_obj:
+        for offset in sorted({0, max(st.st_size - _PARTIAL_HASH_SIZE, 0)}):
+            file_obj.seek(offset)
+            if not file_obj.read(_PARTIAL_HASH_SIZE).strip(b"\x00"):
+                return True
+    return False
+
+
+_CHECK_BATCH = 64  # Torrents checked by the pool at once
+
+
+def iter_damaged_torrents(
+    cache: datacache.TorrentsCache,
+    workers: int,
+) -> Generator[Tuple[str, datacache.CacheEntryAttrs, TorrentsDiff], None, None]:
+
+    # Only stat() for each expected file, the data is never read
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as executor:
+        entries = cache.iter_entries()
+        while True:
+            batch = list(itertools.islice(entries, _CHECK_BATCH))
+            if len(batch) == 0:
+                break
+            paths = [
+                os.path.join(attrs.prefix, path)
+                for (_, attrs) in batch
+                for path in attrs.files
+                if not _is_pad_entry(path)
+            ]
+            found = dict(zip(paths, executor.map(_stat_entry, paths)))
+            for (torrent_hash, attrs) in batch:
+                # The padding files are not stored by the clients, so they are not expected
+                expected: Dict[str, TorrentEntryAttrs] = {}
+                actual: Dict[str, TorrentEntryAttrs] = {}
+                for (path, e_attrs) in attrs.files.items():
+                    if _is_pad_entry(path):
+                        continue
+                    expected[path] = e_attrs
+                    f_attrs = found[os.path.join(attrs.prefix, path)]
+                    if f_attrs is not None:
+                        actual[path] = f_attrs
+                diff = get_torrents_difference(expected, actual)
+                if diff:
+                    yield (torrent_hash, attrs, diff)
+
+
+def _is_pad_entry(path: str) -> bool:
+    return (is_pad_file_path(path) or os.path.basename(path) == ".pad")
+
+
+def _stat_entry(path: str) -> Optional[TorrentEntryAttrs]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        return TorrentEntryAttrs.dir()
+    return TorrentEntryAttrs.file(st.st_size)
+
+
+def print_damaged_torrents(
+    cache: datacache.TorrentsCache,
+    workers: int,
+    report: Report,
+    log_stderr: Log,
+) -> None:
+
+    count = 0
+    for (torrent_hash, attrs, diff) in iter_damaged_torrents(cache, workers):
+        count += 1
+        report.write(
+            {"hash": torrent_hash, "prefix": attrs.prefix, **{
+                field: tools.sorted_paths(getattr(diff, field))
+                for field in ["removed", "modified", "type_modified"]
+            }},
+            ("%s -- %s", (torrent_hash, attrs.prefix)),
+            fmt.format_torrents_diff(diff, "\t"),
+        )
+    if count != 0:
+        log_stderr.info("Found {red}%d{reset} torrents with the missing or damaged files", (count,))
+    else:
+        log_stderr.info("No torrents with the missing or damaged files found")
+
+
 # ===== Main =====
 @wrap_main
 def main() -> None:
@@ -219,6 +606,7 @@ def main() -> None:
         description="Querying the client",
         parents=[parent_parser],
     )
+    args_parser.add_argument("--json", action="store_true")
     commands = args_parser.add_subparsers(dest="cmd")
 
     commands.add_parser(
@@ -246,10 +634,32 @@ def main() -> None:
         help="Find torrent-files with duplicate hashes",
     )
 
+    cmd_parser = commands.add_parser(
+        name="duplicate-files",
+        help="Find the files with the same content in torrents",
+    )
+    cmd_parser.add_argument("--min-size", default=1024 * 1024, type=int, metavar="<bytes>")
+    cmd_parser.add_argument("-j", "--workers", default=config.emfind.scan_workers, type=int, metavar="<number>")
+    cmd_parser.add_argument("--hardlink", action="store_true")
+
+    commands.add_parser(
+        name="check-data",
+        help="Find the missing and damaged files of torrents (by stat only)",
+    ).add_argument("-j", "--workers", default=config.emfind.scan_workers, type=int, metavar="<number>")
+
+    cmd_parser = commands.add_parser(
+        name="match-data",
+        help="Find the data of torrents (by default not registered in the client) in the data roots",
+    )
+    cmd_parser.add_argument("-s", "--samples", default=4, type=int, metavar="<number>")
+    cmd_parser.add_argument("--apply", action="store_true")
+    cmd_parser.add_argument("torrents", type=str, nargs="*", metavar="<path>")
+
     options = args_parser.parse_args(argv[1:])
 
     with get_configured_log(config, False, sys.stdout) as log_stdout:
         with get_configured_log(config, False, sys.stderr) as log_stderr:
+            report = Report(log_stdout, (sys.stdout if options.json else None))
 
             def get_client() -> BaseClient:
                 return get_configured_client(  # type: ignore
@@ -259,29 +669,37 @@ def main() -> None:
                     log=log_stderr,
                 )
 
-            def get_cache(force_rebuild: bool) -> datacache.TorrentsCache:
+            def get_cache(force_rebuild: bool) -> ContextManager[datacache.TorrentsCache]:
                 return datacache.get_cache(
                     cache_path=config.emfind.cache_file,
-                    client=get_client(),
+                    get_client=get_client,
                     files_from_client=config.emfind.files_from_client,
                     force_rebuild=force_rebuild,
+                    update=config.emfind.update_cache,
                     torrents_dir_path=config.core.torrents_dir,
                     name_filter=config.emfind.name_filter,
+                    load_workers=config.core.load_workers,
+                    load_threads=config.core.load_threads,
+                    index_path=config.core.torrents_index_file,
                     log=log_stderr,
                 )
 
             if options.cmd == "rebuild-cache":
-                get_cache(True)
+                with get_cache(True):
+                    pass
 
             elif options.cmd == "orphans":
-                print_orphaned_files(
-                    cache=get_cache(False),
-                    data_roots=[config.core.data_root_dir] + config.core.another_data_root_dirs,
-                    ignore_orphans=config.emfind.ignore_orphans,
-                    reduce_dirs=(not options.no_reduce_dirs),
-                    log_stdout=log_stdout,
-                    log_stderr=log_stderr,
-                )
+                with get_cache(False) as cache:
+                    print_orphaned_files(
+                        cache=cache,
+                        data_roots=[config.core.data_root_dir] + config.core.another_data_root_dirs,
+                        ignore_orphans=config.emfind.ignore_orphans,
+                        reduce_dirs=(not options.no_reduce_dirs),
+                        scan_workers=config.emfind.scan_workers,
+                        snapshot_path=config.emfind.snapshot_file,
+                        report=report,
+                        log_stderr=log_stderr,
+                    )
 
             elif options.cmd in ["not-in-client", "missing-torrents"]:
                 {
@@ -291,7 +709,51 @@ def main() -> None:
                     client=get_client(),
                     torrents_dir_path=config.core.torrents_dir,
                     name_filter=config.emfind.name_filter,
-                    log_stdout=log_stdout,
+                    load_workers=config.core.load_workers,
+                    load_threads=config.core.load_threads,
+                    index_path=config.core.torrents_index_file,
+                    report=report,
+                    log_stderr=log_stderr,
+                )
+
+            elif options.cmd == "duplicate-files":
+                with get_cache(False) as cache:
+                    print_duplicate_files(
+                        cache=cache,
+                        min_size=options.min_size,
+                        workers=options.workers,
+                        hardlink=options.hardlink,
+                        report=report,
+                        log_stderr=log_stderr,
+                    )
+
+            elif options.cmd == "check-data":
+                with get_cache(False) as cache:
+                    print_damaged_torrents(
+                        cache=cache,
+                        workers=options.workers,
+                        report=report,
+                        log_stderr=log_stderr,
+                    )
+
+            elif options.cmd == "match-data":
+                client = (get_client() if options.apply or not options.torrents else None)
+                match_data(
+                    client=(client if options.apply else None),
+                    torrents=(tcollection.find_torrents(config.core.torrents_dir, options.torrents) if options.torrents else load_not_in_client(
+                        client=client,  # type: ignore
+                        torrents_dir_path=config.core.torrents_dir,
+                        name_filter=config.emfind.name_filter,
+                        load_workers=config.core.load_workers,
+                        load_threads=config.core.load_threads,
+                        index_path=config.core.torrents_index_file,
+                        log=log_stderr,
+                    )),
+                    data_roots=[config.core.data_root_dir] + config.core.another_data_root_dirs,
+                    scan_workers=config.emfind.scan_workers,
+                    snapshot_path=config.emfind.snapshot_file,
+                    samples=options.samples,
+                    report=report,
                     log_stderr=log_stderr,
                 )
 
@@ -299,7 +761,10 @@ def main() -> None:
                 print_duplicate_torrents(
                     torrents_dir_path=config.core.torrents_dir,
                     name_filter=config.emfind.name_filter,
-                    log_stdout=log_stdout,
+                    load_workers=config.core.load_workers,
+                    load_threads=config.core.load_threads,
+                    index_path=config.core.torrents_index_file,
+                    report=report,
                     log_stderr=log_stderr,
                 )
 
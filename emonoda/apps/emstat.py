@@ -24,7 +24,6 @@ import operator
 import argparse
 
 from typing import List
-from typing import Dict
 from typing import NamedTuple
 from typing import Optional
 
@@ -93,7 +92,7 @@ def select_tracker(trackers: List[WithStat], torrent: Torrent) -> Optional[WithS
 
 def fetch_stat(
     trackers: List[WithStat],
-    torrents: Dict[str, Optional[Torrent]],
+    torrents: tcollection.TorrentsStream,
     log: Log,
 ) -> List[StatRecord]:
 
@@ -102,7 +101,7 @@ def fetch_stat(
 
     stats: List[StatRecord] = []
     for (name, torrent) in log.progress(
-        sorted(torrents.items(), key=operator.itemgetter(0)),
+        torrents,
         ("Fetching statistics", ()),
         ("Fetched statistics for {magenta}%d{reset} torrents", (lambda: len(stats),)),
     ):
@@ -286,11 +285,14 @@ def main() -> None:
                 log=log_stderr,
             )
 
-            torrents = tcollection.load_from_dir(
+            torrents = tcollection.iter_from_dir(
                 path=config.core.torrents_dir,
                 name_filter=(options.name_filter or config.emupdate.name_filter),
                 precalculate_hashes=bool(options.export),
                 log=log_stderr,
+                workers=config.core.load_workers,
+                use_threads=config.core.load_threads,
+                index_path=config.core.torrents_index_file,
             )
 
             stats = fetch_stat(trackers, torrents, log_stderr)
@@ -24,13 +24,17 @@ import shutil
 import contextlib
 import traceback
 import threading
-import operator
+import itertools
+import collections
+import concurrent.futures
 import argparse
 import types
 
 from typing import Tuple
 from typing import List
 from typing import Dict
+from typing import Deque
+from typing import NamedTuple
 from typing import Generator
 from typing import Callable
 from typing import Optional
@@ -42,6 +46,7 @@ from ..plugins.clients import WithCustoms
 
 from ..plugins.trackers import TrackerError
 from ..plugins.trackers import WithCheckHash
+from ..plugins.trackers import WithBatchCheckHash
 from ..plugins.trackers import WithCheckScrape
 from ..plugins.trackers import WithCheckTime
 from ..plugins.trackers import BaseTracker
@@ -125,7 +130,7 @@ class Feeder:  # pylint: disable=too-many-instance-attributes
     def __init__(  # pylint: disable=too-many-positional-arguments
         self,
         trackers: List[BaseTracker],
-        torrents: Dict[str, Optional[Torrent]],
+        torrents: tcollection.TorrentsStream,
         show_unknown: bool,
         show_passed: bool,
         show_diff: bool,
@@ -160,22 +165,45 @@ class Feeder:  # pylint: disable=too-many-instance-attributes
 
         self._results: ResultsType = {status: {} for status in self._status_mapping}
 
-    def get_ops(self) -> Generator[OpContext, None, None]:
-        for (self._current_count, (self._current_file_name, self._current_torrent)) in enumerate(
-            sorted(self._torrents.items(), key=operator.itemgetter(0))
-        ):
-            self._current_tracker = None
+    def get_ops(
+        self,
+        prepare: Callable[[OpContext], None]=(lambda _: None),
+        lookahead: int=1,
+    ) -> Generator[OpContext, None, None]:
+
+        # The ops are created and prepared ahead of the yielded one, so the caller can start them concurrently,
+        # while the results are still printed in the order of torrents.
+        items = enumerate(self._torrents)
+        window: Deque[Tuple[int, str, Optional[Torrent], Optional[BaseTracker], Optional[OpContext]]] = collections.deque()
+
+        def fill() -> None:
+            for (count, (file_name, torrent)) in itertools.islice(items, max(lookahead, 1) - len(window)):
+                tracker = (self._select_tracker(torrent) if torrent is not None else None)
+                op = (OpContext(torrent, tracker) if torrent is not None and tracker is not None else None)
+                if op is not None:
+                    prepare(op)
+                window.append((count, file_name, torrent, tracker, op))
+
+        fill()
+        while len(window) != 0:
+            (
+                self._current_count,
+                self._current_file_name,
+                self._current_torrent,
+                self._current_tracker,
+                next_op,
+            ) = window.popleft()
+            fill()
 
             if self._current_torrent is None:
                 self._done("invalid")
                 continue
 
-            self._current_tracker = self._select_tracker()
-            if self._current_tracker is None:
+            if next_op is None:
                 self._done("unknown")
                 continue
 
-            op = OpContext(self._current_torrent, self._current_tracker)
+            op = next_op
             self._start_op()
             yield op
             self._stop_op()
@@ -186,10 +214,9 @@ class Feeder:  # pylint: disable=too-many-instance-attributes
     def get_results(self) -> ResultsType:
         return self._results
 
-    def _select_tracker(self) -> Optional[BaseTracker]:
-        assert self._current_torrent
+    def _select_tracker(self, torrent: Torrent) -> Optional[BaseTracker]:
         for tracker in self._trackers:
-            if tracker.is_matched_for(self._current_torrent):
+            if tracker.is_matched_for(torrent):
                 return tracker
         return None
 
@@ -346,56 +373,124 @@ class TorrentTimeInfo:
             time_file.write(str(int(value)))
 
 
-def update(  # pylint: disable=too-many-branches,too-many-locals,too-many-positional-arguments
+class CheckResult(NamedTuple):
+    new_torrent: Optional[Torrent]  # None if there is nothing to update
+    tracker_time: Optional[int]  # For WithCheckTime, to remember it after the fetch
+
+
+def check_torrent(tracker: BaseTracker, torrent: Torrent, test_mode: bool) -> CheckResult:
+    # Only the network part of the update, can be called from the threads
+    tracker_bases = tracker.get_bases()
+    tracker_time: Optional[int] = None
+
+    if WithCheckHash in tracker_bases:
+        need_update = (tracker.fetch_hash(torrent) != torrent.get_hash())  # type: ignore
+
+    elif WithCheckScrape in tracker_bases:
+        need_update = (not tracker.is_registered(torrent))  # type: ignore
+
+    elif WithCheckTime in tracker_bases:
+        tracker_time = tracker.fetch_time(torrent)  # type: ignore
+        need_update = (tracker_time > TorrentTimeInfo(torrent).read())  # Filled by the caller
+
+    else:
+        raise RuntimeError(f"Invalid tracker {tracker}: missing method of check")
+
+    if not (need_update or test_mode):
+        return CheckResult(None, tracker_time)
+    new_torrent = Torrent(data=tracker.fetch_new_data(torrent))
+    if torrent.get_hash() == new_torrent.get_hash() and not test_mode:
+        return CheckResult(None, tracker_time)
+    return CheckResult(new_torrent, tracker_time)
+
+
+def update(  # pylint: disable=too-many-locals,too-many-statements,too-many-positional-arguments
     feeder: Feeder,
     client: Optional[BaseClient],
     backup_dir_path: str,
     backup_suffix: str,
     to_save_customs: List[str],
     to_set_customs: Dict[str, str],
+    lookahead: int,
     noop: bool,
     test_mode: bool,
 ) -> None:
 
-    hashes = (client.get_hashes() if client is not None else [])
-    for op in feeder.get_ops():
+    # The checks and the fetches are going in the thread pools, one per tracker and limited
+    # by its concurrency. The client, the torrent files and the time files are changed in this thread only.
+    # For WithBatchCheckHash the torrents are grouped, and their hashes are fetched by one request
+    # before the checks, when the group is full or when the result of the first one is needed.
+    hashes = set(client.get_hashes() if client is not None else [])
+    executors: Dict[str, concurrent.futures.ThreadPoolExecutor] = {}
+    checks: "Dict[OpContext, concurrent.futures.Future[CheckResult]]" = {}
+    batches: Dict[str, List[OpContext]] = {}
+
+    def get_executor(tracker: BaseTracker) -> concurrent.futures.ThreadPoolExecutor:
+        name = tracker.PLUGIN_NAMES[0]
+        if name not in executors:
+            executors[name] = concurrent.futures.ThreadPoolExecutor(tracker.get_concurrency())
+        return executors[name]
+
+    def check_prefetched(prefetch: "concurrent.futures.Future[None]", op: OpContext) -> CheckResult:
+        concurrent.futures.wait([prefetch])  # Without the prefetched hash the torrent is checked by the page
+        return check_torrent(op.tracker, op.torrent, test_mode)
+
+    def flush(tracker: BaseTracker) -> None:
+        batch = batches.pop(tracker.PLUGIN_NAMES[0], [])
+        if len(batch) != 0:
+            # The prefetch is submitted first, so it's running before the checks waiting for it
+            executor = get_executor(tracker)
+            prefetch = executor.submit(tracker.prefetch_hashes, [op.torrent for op in batch])  # type: ignore
+            for op in batch:
+                checks[op] = executor.submit(check_prefetched, prefetch, op)
+
+    def prepare(op: OpContext) -> None:
         try:
-            with op:
-                if client is not None and op.torrent.get_hash() not in hashes:
-                    op.done_not_in_client()
-                    continue
-
-                tracker_bases = op.tracker.get_bases()
-
-                if WithCheckHash in tracker_bases:
-                    need_update = (op.tracker.fetch_hash(op.torrent) != op.torrent.get_hash())  # type: ignore
-
-                elif WithCheckScrape in tracker_bases:
-                    need_update = (not op.tracker.is_registered(op.torrent))  # type: ignore
-
-                elif WithCheckTime in tracker_bases:
-                    time_info = TorrentTimeInfo(op.torrent).check_and_fill()
-                    tracker_time = op.tracker.fetch_time(op.torrent)  # type: ignore
-                    need_update = (tracker_time > time_info.read())
-
-                else:
-                    raise RuntimeError(f"Invalid tracker {op.tracker}: missing method of check")
-
-                if need_update or test_mode:
-                    tmp_torrent = Torrent(data=op.tracker.fetch_new_data(op.torrent))
-                    if op.torrent.get_hash() != tmp_torrent.get_hash() or test_mode:
-                        diff = get_torrents_difference(op.torrent, tmp_torrent)
+            if client is not None and op.torrent.get_hash() not in hashes:
+                return
+            tracker_bases = op.tracker.get_bases()
+            if WithCheckTime in tracker_bases:
+                TorrentTimeInfo(op.torrent).check_and_fill()
+            if WithBatchCheckHash in tracker_bases:
+                batch = batches.setdefault(op.tracker.PLUGIN_NAMES[0], [])
+                batch.append(op)
+                if len(batch) >= op.tracker.get_batch_size():  # type: ignore
+                    flush(op.tracker)
+            else:
+                checks[op] = get_executor(op.tracker).submit(check_torrent, op.tracker, op.torrent, test_mode)
+        except Exception as err:
+            # Raised by the result in the main loop, so it's the error of this torrent only
+            failed: "concurrent.futures.Future[CheckResult]" = concurrent.futures.Future()
+            failed.set_exception(err)
+            checks[op] = failed
+
+    try:
+        for op in feeder.get_ops(prepare, lookahead):
+            try:
+                with op:
+                    if op in batches.get(op.tracker.PLUGIN_NAMES[0], []):
+                        flush(op.tracker)
+                    check = checks.pop(op, None)
+                    if check is None:
+                        op.done_not_in_client()
+                        continue
+
+                    result = check.result()
+                    if result.new_torrent is not None:
+                        diff = get_torrents_difference(op.torrent, result.new_torrent)
                         if not noop:
                             if backup_dir_path:
                                 backup_torrent(op.torrent, backup_dir_path, backup_suffix)
-                            update_torrent(client, op.torrent, tmp_torrent.get_data(), to_save_customs, to_set_customs)
-                            if WithCheckTime in tracker_bases:
-                                time_info.write(tracker_time)
+                            update_torrent(client, op.torrent, result.new_torrent.get_data(), to_save_customs, to_set_customs)
+                    if result.tracker_time is not None and not noop:
+                        TorrentTimeInfo(op.torrent).write(result.tracker_time)
+                    if result.new_torrent is not None:
                         op.done_affected(diff)
-                    elif WithCheckTime in tracker_bases and not noop:
-                        time_info.write(tracker_time)
-        except Exception:
-            pass
+            except Exception:
+                pass
+    finally:
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
 
 
 def print_results(results: ResultsType, log: Log) -> None:
@@ -469,11 +564,14 @@ def main() -> None:
                     log=log_stderr,
                 )
 
-            torrents = tcollection.load_from_dir(
+            torrents = tcollection.iter_from_dir(
                 path=config.core.torrents_dir,
                 name_filter=(options.name_filter or config.emupdate.name_filter),
                 precalculate_hashes=True,
                 log=log_stderr,
+                workers=config.core.load_workers,
+                use_threads=config.core.load_threads,
+                index_path=config.core.torrents_index_file,
             )
 
             feeder = Feeder(
@@ -492,6 +590,7 @@ def main() -> None:
                 backup_suffix=config.emupdate.backup_suffix,
                 to_save_customs=config.emupdate.save_customs,
                 to_set_customs=config.emupdate.set_customs,
+                lookahead=config.emupdate.lookahead,
                 noop=options.noop,
                 test_mode=options.test_mode,
             )
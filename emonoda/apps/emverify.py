@@ -0,0 +1,172 @@
+"""
+    Emonoda -- A set of tools to organize and manage your torrents
+    Copyright (C) 2015  Devaev Maxim <mdevaev@gmail.com>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+import os
+import concurrent.futures
+import argparse
+
+from typing import List
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+
+from ..plugins.clients import NoSuchTorrentError
+from ..plugins.clients import BaseClient
+
+from ..helpers import tcollection
+from ..helpers import datapieces
+
+from ..tfile import Torrent
+
+from ..cli import Log
+
+from . import init
+from . import wrap_main
+from . import get_configured_log
+from . import get_configured_client
+
+
+# =====
+class VerifyResult(NamedTuple):
+    bad_pieces: Dict[str, int]  # {path: count}
+    missing: List[str]
+
+
+def verify_torrent(  # pylint: disable=too-many-positional-arguments,too-many-locals
+    torrent: Torrent,
+    prefix: str,
+    workers: int,
+    chunk_size: int,
+    log: Log,
+) -> VerifyResult:
+
+    piece_length = torrent.get_piece_length()
+    pieces = torrent.get_pieces()
+    if len(pieces) == 0 or len(pieces) % 20 != 0:
+        raise RuntimeError("No v1 piece hashes in the torrent")
+
+    files = datapieces.get_data_files(torrent, prefix)
+    total = sum(data_file.size for data_file in files)
+    count = len(pieces) // 20
+    if (total + piece_length - 1) // piece_length != count:
+        raise RuntimeError("The number of pieces doesn't match the files size")
+
+    chunk_pieces = max(chunk_size // piece_length, 1)
+    bad_pieces: Dict[str, int] = {}
+    checked = 0
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        # The list is sized, so the progress bar follows the chunks as they are verified
+        futures = [
+            executor.submit(datapieces.verify_pieces, files, piece_length, pieces, first, min(first + chunk_pieces, count))
+            for first in range(0, count, chunk_pieces)
+        ]
+        for future in log.progress(
+            futures,
+            ("Verifying {cyan}%s{reset}", (torrent.get_name(),)),
+            ("Verified {magenta}%d{reset} pieces of {cyan}%s{reset}", (lambda: checked, torrent.get_name())),
+        ):
+            bad = future.result()
+            checked = min(checked + chunk_pieces, count)
+            for piece in bad:
+                for data_file in datapieces.get_piece_files(files, piece * piece_length, (piece + 1) * piece_length):
+                    if data_file.pad:
+                        continue
+                    bad_pieces.setdefault(data_file.path, 0)
+                    bad_pieces[data_file.path] += 1
+
+    return VerifyResult(
+        bad_pieces=bad_pieces,
+        missing=[data_file.path for data_file in files if not data_file.pad and not os.path.exists(data_file.path)],
+    )
+
+
+def print_result(torrent: Torrent, result: VerifyResult, log: Log) -> None:
+    if len(result.bad_pieces) == 0:
+        log.print("{green}OK{reset}   %s", (torrent.get_path(),))
+    else:
+        log.print("{red}FAIL{reset} %s", (torrent.get_path(),))
+        for (path, count) in sorted(result.bad_pieces.items()):
+            if path in result.missing:
+                log.print("\t{red}missing{reset} %s", (path,))
+            else:
+                log.print("\t{red}%d{reset} bad pieces in %s", (count, path))
+
+
+# ===== Main =====
+@wrap_main
+def main() -> None:
+    (parent_parser, argv, config) = init()
+    args_parser = argparse.ArgumentParser(
+        prog="emverify",
+        description="Verify the downloaded data of torrents by the piece hashes",
+        parents=[parent_parser],
+    )
+    args_parser.add_argument("-d", "--data-prefix", default="", metavar="<dir>")
+    args_parser.add_argument("-j", "--workers", default=config.emverify.workers, type=int, metavar="<number>")
+    args_parser.add_argument("-v", "--verbose", action="store_true")
+    args_parser.add_argument("torrents", type=str, nargs="+", metavar="<path>")
+    options = args_parser.parse_args(argv[1:])
+
+    torrents = tcollection.find_torrents(config.core.torrents_dir, options.torrents)
+    workers = (options.workers if options.workers > 0 else (os.cpu_count() or 1))
+
+    with get_configured_log(config, False, sys.stdout) as log_stdout:
+        with get_configured_log(config, (not options.verbose), sys.stderr) as log_stderr:
+            client: Optional[BaseClient] = None
+            if not options.data_prefix:
+                client = get_configured_client(
+                    config=config,
+                    required=True,
+                    with_customs=False,
+                    log=log_stderr,
+                )
+
+            failed = 0
+            for torrent in torrents:
+                try:
+                    prefix = (options.data_prefix or client.get_data_prefix(torrent))  # type: ignore
+                except NoSuchTorrentError:
+                    log_stderr.error("No such torrent in client: {cyan}%s{reset}", (torrent.get_path(),))
+                    failed += 1
+                    continue
+
+                try:
+                    result = verify_torrent(
+                        torrent=torrent,
+                        prefix=prefix,
+                        workers=workers,
+                        chunk_size=config.emverify.chunk_size,
+                        log=log_stderr,
+                    )
+                except RuntimeError as err:
+                    log_stderr.error("Can't verify {cyan}%s{reset}: {red}%s{reset}", (torrent.get_path(), err))
+                    failed += 1
+                    continue
+                print_result(torrent, result, log_stdout)
+                if len(result.bad_pieces) != 0:
+                    failed += 1
+
+            log_stderr.info("Verified {magenta}%d{reset} torrents, failed: {red}%d{reset}", (len(torrents), failed))
+            if failed:
+                raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()  # Do the thing!
@@ -0,0 +1,67 @@
+"""
+    Emonoda -- A set of tools to organize and manage your torrents
+    Copyright (C) 2015  Devaev Maxim <mdevaev@gmail.com>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+import argparse
+
+from ....helpers import datacache
+
+from ... import init
+from ... import wrap_main
+from ... import get_configured_log
+from ... import get_configured_client
+
+
+# ===== Main =====
+@wrap_main
+def main() -> None:
+    (parent_parser, argv, config) = init()
+    args_parser = argparse.ArgumentParser(
+        prog="emhook-rtorrent-update-cache",
+        description="Apply the added and erased torrents to the emfind cache (rtorrent events)",
+        parents=[parent_parser],
+    )
+    args_parser.add_argument("--add", default=[], nargs="+", metavar="<hash>")
+    args_parser.add_argument("--remove", default=[], nargs="+", metavar="<hash>")
+    args_parser.add_argument("-v", "--verbose", action="store_true")
+    options = args_parser.parse_args(argv[1:])
+
+    with get_configured_log(config, (not options.verbose), sys.stderr) as log_stderr:
+        with datacache.open_existing_cache(config.emfind.cache_file, log_stderr) as cache:
+            if cache is not None:
+                datacache.update_by_hashes(
+                    cache=cache,
+                    client=(get_configured_client(
+                        config=config,
+                        required=True,
+                        with_customs=False,
+                        log=log_stderr,
+                    ) if options.add else None),
+                    to_add=list(map(str.lower, options.add)),
+                    to_remove=list(map(str.lower, options.remove)),
+                    files_from_client=config.emfind.files_from_client,
+                    torrents_dir_path=config.core.torrents_dir,
+                    name_filter=config.emfind.name_filter,
+                    index_path=config.core.torrents_index_file,
+                    log=log_stderr,
+                )
+
+
+if __name__ == "__main__":
+    main()  # Do the thing!
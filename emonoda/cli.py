@@ -21,6 +21,7 @@ import sys
 import os
 import re
 import time
+import collections.abc
 
 from enum import Enum
 
@@ -151,19 +152,22 @@ class Log:
     ) -> Generator[Any, None, None]:
 
         if self.isatty():
-            items = list(iterable)
+            # Sized streams are consumed lazily, the others are materialized to get the total
+            if not isinstance(iterable, collections.abc.Sized):
+                iterable = list(iterable)
+            total = len(iterable)  # type: ignore
 
             current = 0
             prev = 0.0
-            for (current, item) in enumerate(items, 1):
+            for (current, item) in enumerate(iterable, 1):
                 now = time.time()
                 if prev + refresh < now:
-                    (pb, pb_placeholders) = fmt.format_progress_bar(current, len(items), length)
+                    (pb, pb_placeholders) = fmt.format_progress_bar(current, total, length)
                     self.info(f"{pb} :: {wip[0]}", pb_placeholders + wip[1], one_line=True)
                     prev = now
                 yield item
 
-            (pb, pb_placeholders) = fmt.format_progress_bar(current, len(items), length)
+            (pb, pb_placeholders) = fmt.format_progress_bar(current, total, length)
             self.info(f"{pb} :: {finish[0]}", pb_placeholders + finish[1])
 
         else:
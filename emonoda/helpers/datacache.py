@@ -18,10 +18,19 @@
 
 
 import os
-import pickle
-
-from typing import Dict
+import sqlite3
+import contextlib
+import itertools
+import operator
+
+from typing import Tuple
+from typing import Set
+from typing import List
+from typing import Mapping
 from typing import NamedTuple
+from typing import Generator
+from typing import Callable
+from typing import Optional
 
 from ..plugins.clients import BaseClient
 
@@ -34,113 +43,278 @@ from . import tcollection
 
 # =====
 class CacheEntryAttrs(NamedTuple):
-    files: Dict[str, TorrentEntryAttrs]
+    files: Mapping[str, TorrentEntryAttrs]
     prefix: str
 
 
-class TorrentsCache(NamedTuple):
-    version: int
-    torrents: Dict[str, CacheEntryAttrs]
-
-
-def get_cache(  # pylint: disable=too-many-positional-arguments
+class TorrentsCache:
+    # The torrents and their files are stored in SQLite as separate rows,
+    # so the updates don't rewrite the whole cache and the files can be read by one torrent.
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.__conn = conn
+
+    def get_hashes(self) -> Set[str]:
+        return {row[0] for row in self.__conn.execute("SELECT hash FROM torrents")}
+
+    def iter_entries(self) -> Generator[Tuple[str, CacheEntryAttrs], None, None]:
+        rows = self.__conn.execute(
+            "SELECT files.hash, torrents.prefix, files.path, files.is_dir, files.size"
+            " FROM files JOIN torrents ON torrents.hash = files.hash ORDER BY files.hash, files.rowid"
+        )
+        for ((torrent_hash, prefix), torrent_rows) in itertools.groupby(rows, key=operator.itemgetter(0, 1)):
+            yield (torrent_hash, CacheEntryAttrs(
+                files={
+                    path: (TorrentEntryAttrs.dir() if is_dir else TorrentEntryAttrs.file(size))
+                    for (_, _, path, is_dir, size) in torrent_rows
+                },
+                prefix=prefix,
+            ))
+
+    def get_prefixes(self) -> Set[str]:
+        return {row[0] for row in self.__conn.execute("SELECT DISTINCT prefix FROM torrents")}
+
+    def iter_files_sorted(self) -> Generator[Tuple[str, TorrentEntryAttrs], None, None]:
+        # The full paths of all files in the order of tools.sorted_paths().
+        # SQLite sorts them in its temporary storage, so the memory doesn't depend on the number of files.
+        rows = self.__conn.execute(
+            "SELECT rtrim(torrents.prefix, '/') || '/' || files.path AS full_path, files.is_dir, files.size"
+            " FROM files JOIN torrents ON torrents.hash = files.hash ORDER BY replace(full_path, '/', char(0))"
+        )
+        for (path, is_dir, size) in rows:
+            yield (path, (TorrentEntryAttrs.dir() if is_dir else TorrentEntryAttrs.file(size)))
+
+    def iter_same_size_files(self, min_size: int) -> Generator[Tuple[int, List[str]], None, None]:
+        # The groups of the full paths of files with the same size, one group in memory at a time
+        rows = self.__conn.execute(
+            "SELECT files.size, rtrim(torrents.prefix, '/') || '/' || files.path"
+            " FROM files JOIN torrents ON torrents.hash = files.hash"
+            " WHERE files.is_dir = 0 AND files.size IN ("
+            "  SELECT size FROM files WHERE is_dir = 0 AND size >= ? GROUP BY size HAVING COUNT(*) > 1"
+            " ) ORDER BY files.size DESC",
+            (max(min_size, 1),),
+        )
+        for (size, size_rows) in itertools.groupby(rows, key=operator.itemgetter(0)):
+            yield (size, sorted({path for (_, path) in size_rows}))
+
+    def add(self, torrent_hash: str, attrs: CacheEntryAttrs) -> None:
+        self.__conn.execute("INSERT OR REPLACE INTO torrents (hash, prefix) VALUES (?, ?)",
+                            (torrent_hash, os.path.normpath(attrs.prefix)))
+        self.__conn.execute("DELETE FROM files WHERE hash = ?", (torrent_hash,))
+        self.__conn.executemany(
+            "INSERT INTO files (hash, path, is_dir, size) VALUES (?, ?, ?, ?)",
+            ((torrent_hash, path, f_attrs.is_dir, f_attrs.size) for (path, f_attrs) in attrs.files.items()),
+        )
+
+    def remove(self, torrent_hash: str) -> None:
+        self.__conn.execute("DELETE FROM files WHERE hash = ?", (torrent_hash,))
+        self.__conn.execute("DELETE FROM torrents WHERE hash = ?", (torrent_hash,))
+
+    def commit(self) -> None:
+        self.__conn.commit()
+
+
+_CACHE_VERSION = 2
+_CLIENT_BATCH = 100  # Hashes per the batch request to client
+_LOCK_TIMEOUT = 60.0  # The hooks may be started concurrently for many torrents
+
+
+@contextlib.contextmanager
+def get_cache(  # pylint: disable=too-many-arguments,too-many-positional-arguments
     cache_path: str,
-    client: BaseClient,
+    get_client: Callable[[], BaseClient],
     files_from_client: bool,
     force_rebuild: bool,
+    update: bool,
     torrents_dir_path: str,
     name_filter: str,
+    load_workers: int,
+    load_threads: bool,
+    index_path: str,
     log: Log,
-) -> TorrentsCache:
+) -> Generator[TorrentsCache, None, None]:
+
+    # Without the update the cache is trusted as is, it is expected to be maintained by the hooks.
+    # The new cache is filled anyway.
+    with _connect(cache_path, force_rebuild, log) as (conn, created):
+        cache = TorrentsCache(conn)
+        if update or created:
+            _update(cache, get_client(), files_from_client, torrents_dir_path, name_filter,
+                    load_workers, load_threads, index_path, log)
+        yield cache
+
+
+@contextlib.contextmanager
+def open_existing_cache(cache_path: str, log: Log) -> Generator[Optional[TorrentsCache], None, None]:
+    # For the hooks: the missing or outdated cache will be built by emfind, so it's not created here
+    conn = _open_existing_db(cache_path)
+    if conn is None:
+        log.error("No valid cache, it will be built by emfind: {red}%s{reset}", (cache_path,))
+        yield None
+    else:
+        try:
+            yield TorrentsCache(conn)
+        finally:
+            conn.close()
 
-    cache = _read(cache_path, force_rebuild, log)
-    if _update(cache, client, files_from_client, torrents_dir_path, name_filter, log):
-        _write(cache, cache_path, log)
-    return cache
 
+def update_by_hashes(  # pylint: disable=too-many-positional-arguments
+    cache: TorrentsCache,
+    client: Optional[BaseClient],
+    to_add: List[str],
+    to_remove: List[str],
+    files_from_client: bool,
+    torrents_dir_path: str,
+    name_filter: str,
+    index_path: str,
+    log: Log,
+) -> None:
 
-# =====
-def _read(path: str, force_rebuild: bool, log: Log) -> TorrentsCache:
-    fallback = TorrentsCache(
-        version=0,
-        torrents={},
-    )
-    if force_rebuild or not os.path.exists(path):
-        return fallback
-
-    log.info("Reading the cache from {cyan}%s{reset} ...", (path,))
-    with open(path, "rb") as cache_file:
-        try:
-            cache_low = pickle.load(cache_file)
-            if cache_low["version"] != fallback.version:
-                return fallback
+    # For the hooks. Like the full update, only the torrents having the torrent files are added.
+    # The unchanged torrent files are found by the index without loading the whole directory.
+    for torrent_hash in to_remove:
+        cache.remove(torrent_hash)
+        log.info("Removed from cache: {cyan}%s{reset}", (torrent_hash,))
+    if len(to_add) != 0:
+        assert client is not None, "Required client to add the torrents"
+        torrents = tcollection.find_by_hashes(torrents_dir_path, name_filter, to_add, log, index_path)
+        for torrent_hash in to_add:
+            if torrent_hash not in torrents:
+                log.error("Not cached - missing torrent for: {red}%s{reset} -- %s",
+                          (torrent_hash, client.get_file_name(torrent_hash)))
+        to_add = [torrent_hash for torrent_hash in to_add if torrent_hash in torrents]
+        if len(to_add) != 0:
+            if files_from_client:
+                entries = {
+                    torrent_hash: CacheEntryAttrs(files=data.files, prefix=data.prefix)
+                    for (torrent_hash, data) in client.get_files_many(to_add).items()
+                }
             else:
-                return TorrentsCache(
-                    version=cache_low["version"],
-                    torrents=pickle.loads(cache_low["torrents_pk"]),
-                )
-        except (KeyError, ValueError, pickle.UnpicklingError):
-            log.error("Can't unpickle cache file - ingored: {red}%s{reset}", (path,))
-            return fallback
+                entries = {
+                    torrent_hash: CacheEntryAttrs(files=torrents[torrent_hash].get_files(), prefix=prefix)
+                    for (torrent_hash, prefix) in client.get_data_prefixes(to_add).items()
+                }
+            for (torrent_hash, attrs) in entries.items():
+                cache.add(torrent_hash, attrs)
+                log.info("Added to cache: {cyan}%s{reset}", (torrent_hash,))
+    cache.commit()
 
 
-def _write(cache: TorrentsCache, path: str, log: Log) -> None:
+# =====
+@contextlib.contextmanager
+def _connect(path: str, force_rebuild: bool, log: Log) -> Generator[Tuple[sqlite3.Connection, bool], None, None]:
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    log.info("Writing the cache to {cyan}%s{reset} ...", (path,))
-    with open(path, "wb") as cache_file:
-        pickle.dump({
-            "version": cache.version,
-            "torrents_pk": pickle.dumps(cache.torrents),
-        }, cache_file)
-
-
-def _update(  # pylint: disable=too-many-positional-arguments
+    log.info("Opening the cache {cyan}%s{reset} ...", (path,))
+    try:
+        (conn, created) = _open_db(path, force_rebuild)
+    except sqlite3.DatabaseError:
+        log.error("Can't read cache file - recreated: {red}%s{reset}", (path,))
+        os.remove(path)
+        (conn, created) = _open_db(path, True)
+    try:
+        yield (conn, created)
+    finally:
+        conn.close()
+
+
+def _open_existing_db(path: str) -> Optional[sqlite3.Connection]:
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path, timeout=_LOCK_TIMEOUT)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] == _CACHE_VERSION:
+            return conn
+    except sqlite3.DatabaseError:
+        pass
+    conn.close()
+    return None
+
+
+def _open_db(path: str, force_rebuild: bool) -> Tuple[sqlite3.Connection, bool]:
+    conn = sqlite3.connect(path, timeout=_LOCK_TIMEOUT)
+    try:
+        created = (force_rebuild or conn.execute("PRAGMA user_version").fetchone()[0] != _CACHE_VERSION)
+        if created:
+            conn.executescript(f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS torrents;
+                CREATE TABLE torrents (hash TEXT PRIMARY KEY, prefix TEXT NOT NULL);
+                CREATE TABLE files (hash TEXT NOT NULL, path TEXT NOT NULL, is_dir INTEGER NOT NULL, size INTEGER NOT NULL);
+                CREATE INDEX files_hash ON files (hash);
+                CREATE INDEX files_path ON files (path);
+                PRAGMA user_version = {_CACHE_VERSION};
+            """)
+        return (conn, created)
+    except Exception:
+        conn.close()
+        raise
+
+
+def _update(  # pylint: disable=too-many-positional-arguments,too-many-locals
     cache: TorrentsCache,
     client: BaseClient,
     files_from_client: bool,
     path: str,
     name_filter: str,
+    load_workers: int,
+    load_threads: bool,
+    index_path: str,
     log: Log,
-) -> bool:
+) -> None:
 
     log.info("Fetching all hashes from client ...")
     hashes = client.get_hashes()
 
     log.info("Validating the cache ...")
+    cached = cache.get_hashes()
 
     # --- Old ---
-    to_remove = sorted(set(cache.torrents).difference(hashes))
+    to_remove = sorted(cached.difference(hashes))
     if len(to_remove) != 0:
         for torrent_hash in to_remove:
-            cache.torrents.pop(torrent_hash)
+            cache.remove(torrent_hash)
+        cache.commit()
         log.info("Removed {magenta}%d{reset} obsolete hashes from cache", (len(to_remove),))
 
     # --- New ---
-    to_add = sorted(set(hashes).difference(cache.torrents))
+    to_add = sorted(set(hashes).difference(cached))
     added = 0
     if len(to_add) != 0:
-        torrents = tcollection.by_hash(tcollection.load_from_dir(path, name_filter, True, log))
+        torrents = tcollection.by_hash(tcollection.iter_from_dir(path, name_filter, True, log, load_workers, load_threads, index_path, True))
 
         if not log.isatty():
             log.info("Adding files for the new {yellow}%d{reset} hashes ...", (len(to_add),))
 
-        for torrent_hash in log.progress(
-            to_add,
+        batches = [to_add[index:index + _CLIENT_BATCH] for index in range(0, len(to_add), _CLIENT_BATCH)]
+        for batch in log.progress(
+            batches,
             ("Adding files ...", ()),
             ("Added {magenta}%d{reset} new hashes from client", (lambda: added,))
         ):
-            torrent = torrents.get(torrent_hash)
-            if torrent is not None:
-                cache.torrents[torrent_hash] = CacheEntryAttrs(
-                    files=(client.get_files(torrent) if files_from_client else torrent.get_files()),
-                    prefix=client.get_data_prefix(torrent),
-                )
-                added += 1
+            for torrent_hash in batch:
+                if torrent_hash not in torrents:
+                    log.error("Not cached - missing torrent for: {red}%s{reset} -- %s",
+                              (torrent_hash, client.get_file_name(torrent_hash)))
+            batch = [torrent_hash for torrent_hash in batch if torrent_hash in torrents]
+            if len(batch) == 0:
+                continue
+
+            if files_from_client:
+                entries = {
+                    torrent_hash: CacheEntryAttrs(files=data.files, prefix=data.prefix)
+                    for (torrent_hash, data) in client.get_files_many(batch).items()
+                }
             else:
-                log.error("Not cached - missing torrent for: {red}%s{reset} -- %s",
-                          (torrent_hash, client.get_file_name(torrent_hash)))
+                entries = {
+                    torrent_hash: CacheEntryAttrs(files=torrents[torrent_hash].get_files(), prefix=prefix)
+                    for (torrent_hash, prefix) in client.get_data_prefixes(batch).items()
+                }
 
+            for (torrent_hash, attrs) in entries.items():
+                cache.add(torrent_hash, attrs)
+            added += len(entries)
+            cache.commit()  # Keep the progress if interrupted
+
+        cache.commit()
         if not log.isatty() and added != 0:
             log.info("Added {magenta}%d{reset} new hashes from client", (added,))
-
-    return bool(len(to_remove) or added)
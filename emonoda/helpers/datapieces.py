@@ -0,0 +1,136 @@
+"""
+    Emonoda -- A set of tools to organize and manage your torrents
+    Copyright (C) 2015  Devaev Maxim <mdevaev@gmail.com>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import mmap
+import hashlib
+import bisect
+
+from typing import Tuple
+from typing import List
+from typing import Dict
+from typing import NamedTuple
+from typing import Generator
+from typing import Optional
+
+from ..tfile import Torrent
+
+
+# =====
+class DataFile(NamedTuple):
+    path: str
+    offset: int  # In the torrent data stream
+    size: int
+    pad: bool  # BEP 47, the zeros without the file on the disk
+
+
+def get_data_files(torrent: Torrent, prefix: str) -> List[DataFile]:
+    files: List[DataFile] = []
+    pads = torrent.get_pad_files(prefix)
+    offset = 0
+    for (path, attrs) in torrent.get_files(prefix).items():
+        if not attrs.is_dir:
+            files.append(DataFile(path, offset, attrs.size, (path in pads)))
+            offset += attrs.size
+    return files
+
+
+def get_piece_files(
+    files: List[DataFile],
+    start: int,
+    end: int,
+    offsets: Optional[List[int]]=None,
+) -> Generator[DataFile, None, None]:
+
+    # The non-empty files having the bytes of [start, end) of the data stream
+    if offsets is None:
+        offsets = [data_file.offset for data_file in files]
+    for data_file in files[max(bisect.bisect_right(offsets, start) - 1, 0):]:
+        if data_file.offset >= end:
+            break
+        if data_file.size > 0 and data_file.offset + data_file.size > start:
+            yield data_file
+
+
+def verify_pieces(  # pylint: disable=too-many-locals
+    files: List[DataFile],
+    piece_length: int,
+    pieces: bytes,
+    first: int,
+    last: int,
+) -> List[int]:
+
+    # Runs in the threads: hashlib and the page faults of mmap don't hold the GIL
+
+    total = (files[-1].offset + files[-1].size if files else 0)
+    offsets = [data_file.offset for data_file in files]  # For all pieces of the chunk
+    maps: Dict[str, Optional[Tuple[mmap.mmap, memoryview]]] = {}
+
+    def get_view(data_file: DataFile) -> Optional[memoryview]:
+        if data_file.path not in maps:
+            maps[data_file.path] = None
+            try:
+                with open(data_file.path, "rb") as file_obj:
+                    data = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+                    maps[data_file.path] = (data, memoryview(data))
+            except (OSError, ValueError):  # ValueError for the empty file
+                pass
+        mapped = maps[data_file.path]
+        return (mapped[1] if mapped is not None else None)
+
+    bad: List[int] = []
+    try:
+        for piece in range(first, last):
+            start = piece * piece_length
+            end = min(start + piece_length, total)
+            piece_hash = hashlib.sha1()
+            ok = True
+            for data_file in get_piece_files(files, start, end, offsets):
+                file_start = max(start, data_file.offset) - data_file.offset
+                file_end = min(end, data_file.offset + data_file.size) - data_file.offset
+                if data_file.pad:
+                    piece_hash.update(bytes(file_end - file_start))
+                    continue
+                view = get_view(data_file)
+                if view is None or len(view) < file_end:
+                    ok = False
+                    break
+                piece_hash.update(view[file_start:file_end])
+            if not ok or piece_hash.digest() != pieces[piece * 20:(piece + 1) * 20]:
+                bad.append(piece)
+    finally:
+        for mapped in maps.values():
+            if mapped is not None:
+                mapped[1].release()
+                mapped[0].close()
+    return bad
+
+
+def check_sampled_pieces(torrent: Torrent, prefix: str, samples: int) -> bool:
+    # Hashes a few pieces spread over the data instead of the whole data
+    piece_length = torrent.get_piece_length()
+    pieces = torrent.get_pieces()
+    count = len(pieces) // 20
+    files = get_data_files(torrent, prefix)
+    if count == 0 or len(files) == 0:
+        return False
+    samples = max(min(samples, count), 1)
+    for piece in sorted({index * (count - 1) // max(samples - 1, 1) for index in range(samples)}):
+        if verify_pieces(files, piece_length, pieces, piece, piece + 1):
+            return False
+    return True
@@ -0,0 +1,241 @@
+"""
+    Emonoda -- A set of tools to organize and manage your torrents
+    Copyright (C) 2015  Devaev Maxim <mdevaev@gmail.com>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import pickle
+import time
+import queue
+import threading
+import itertools
+import operator
+import collections
+import concurrent.futures
+
+from typing import Tuple
+from typing import List
+from typing import Dict
+from typing import Deque
+from typing import NamedTuple
+from typing import Generator
+from typing import Optional
+from typing import Union
+
+from ..tfile import TorrentEntryAttrs
+
+from ..cli import Log
+
+from .. import tools
+
+
+# =====
+class _SnapshotEntry(NamedTuple):
+    stat: Optional[Tuple[int, int, int, int]]  # (dev, inode, mtime_ns, ctime_ns), None if can't be reused
+    files: List[Tuple[str, int]]  # [(name, size), ...]
+    subdirs: List[str]
+
+
+_Snapshot = Dict[str, _SnapshotEntry]
+
+
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_RACY_NS = 2 * 10 ** 9  # The directories changed just now may change again in the same mtime tick
+
+_ROOT_BATCH = 256  # Items passed from the walker of the root at once
+_ROOT_READAHEAD = 64  # Batches walked ahead for each root while the previous ones are consumed
+
+
+def iter_data_roots(  # pylint: disable=too-many-locals
+    data_roots: List[str],
+    workers: int,
+    log: Log,
+    snapshot_path: str="",
+) -> Generator[Tuple[str, TorrentEntryAttrs], None, None]:
+
+    # Yields the files and directories in the order of tools.sorted_paths() while walking,
+    # so the memory is proportional to the depth of the tree instead of the number of files.
+    # Each root is walked by its own thread and the next directories are listed ahead by the threads,
+    # so the separate disks and network mounts are read concurrently. The roots are yielded in order,
+    # the next ones are walked ahead up to the limited number of items. With the snapshot the directory is listed only if its mtime was changed
+    # since the last scan, the children of unchanged ones are taken from the snapshot.
+    # The snapshot keeps the lists of all directories in memory, so it's optional.
+    old_snapshot = (_read_snapshot(snapshot_path, log) if snapshot_path else {})
+    new_snapshot: _Snapshot = {}
+    lookahead = max(workers, 1)
+    count = 0
+
+    roots: List[str] = []
+    for path in tools.sorted_paths(set(data_roots)):
+        if not any(path.startswith(root + os.path.sep) for root in roots):  # Nested roots are walked once
+            roots.append(path)
+
+    stop = threading.Event()
+    outs: List["queue.Queue[_RootBatch]"] = [queue.Queue(_ROOT_READAHEAD) for _ in roots]
+    with concurrent.futures.ThreadPoolExecutor(max(len(roots), 1)) as walkers:
+        try:
+            for (path, out) in zip(roots, outs):
+                walkers.submit(_walk_root, path, lookahead, old_snapshot, new_snapshot, out, stop)
+            for (path, out) in zip(roots, outs):
+                log.info("Scanning directory {cyan}%s{reset} ...", (path,))
+                while True:
+                    batch = out.get()
+                    if batch is None:
+                        break
+                    if isinstance(batch, Exception):
+                        raise batch
+                    count += len(batch)
+                    yield from batch
+        finally:
+            stop.set()
+
+    if snapshot_path:
+        reused = sum(1 for (path, entry) in new_snapshot.items() if old_snapshot.get(path) is entry)
+        log.info("Reused {magenta}%d{reset} of {yellow}%d{reset} directories from the snapshot",
+                 (reused, len(new_snapshot)))
+        _write_snapshot(snapshot_path, new_snapshot)
+
+    log.info("Scanned {magenta}%d{reset} files and directories", (count,))
+
+
+_RootBatch = Union[List[Tuple[str, TorrentEntryAttrs]], Exception, None]  # None is the end of the root
+
+
+def _walk_root(  # pylint: disable=too-many-positional-arguments
+    path: str,
+    lookahead: int,
+    old_snapshot: _Snapshot,
+    new_snapshot: _Snapshot,
+    out: "queue.Queue[_RootBatch]",
+    stop: threading.Event,
+) -> None:
+
+    def put(batch: _RootBatch) -> bool:
+        while not stop.is_set():
+            try:
+                out.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False  # The consumer is gone
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(lookahead) as executor:
+            future = executor.submit(_get_snapshot_entry, path, old_snapshot.get(path))
+            items = _iter_tree(executor, lookahead, path, tools.get_decoded_path(path), future, old_snapshot, new_snapshot)
+            while True:
+                batch = list(itertools.islice(items, _ROOT_BATCH))
+                if len(batch) == 0:
+                    break
+                if not put(batch):
+                    return
+        put(None)
+    except Exception as err:
+        put(err)
+
+
+def _iter_tree(  # pylint: disable=too-many-positional-arguments,too-many-locals
+    executor: concurrent.futures.Executor,
+    lookahead: int,
+    path: str,
+    decoded_path: str,
+    future: "concurrent.futures.Future[_SnapshotEntry]",
+    old_snapshot: _Snapshot,
+    new_snapshot: _Snapshot,
+) -> Generator[Tuple[str, TorrentEntryAttrs], None, None]:
+
+    # Like os.walk(): the unreadable directories and the symlinks to directories are skipped,
+    # the symlinks to files are counted by the target size.
+    try:
+        entry = future.result()
+    except OSError:
+        return
+    new_snapshot[path] = entry
+    yield (decoded_path, TorrentEntryAttrs.dir())
+
+    decoder = tools.BytesDecoder(["cp1251"])  # The same encoding is expected for the whole directory
+    children = sorted((
+        (tools.get_decoded_path(name, decoder), name, size)
+        for (name, size) in itertools.chain(entry.files, ((name, None) for name in entry.subdirs))
+    ), key=operator.itemgetter(0))
+
+    subdirs = (os.path.join(path, name) for (_, name, size) in children if size is None)
+    pending: Deque["concurrent.futures.Future[_SnapshotEntry]"] = collections.deque()
+
+    def fill() -> None:
+        for subdir_path in itertools.islice(subdirs, lookahead - len(pending)):
+            pending.append(executor.submit(_get_snapshot_entry, subdir_path, old_snapshot.get(subdir_path)))
+
+    fill()
+    for (decoded_name, name, size) in children:
+        if size is None:
+            subdir_future = pending.popleft()
+            fill()
+            yield from _iter_tree(
+                executor, lookahead,
+                os.path.join(path, name), os.path.join(decoded_path, decoded_name),
+                subdir_future, old_snapshot, new_snapshot,
+            )
+        else:
+            yield (os.path.join(decoded_path, decoded_name), TorrentEntryAttrs.file(size))
+
+
+def _get_snapshot_entry(path: str, cached: Optional[_SnapshotEntry]) -> _SnapshotEntry:
+    st = os.stat(path)
+    stat: Optional[Tuple[int, int, int, int]] = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_ctime_ns)
+    if cached is not None and cached.stat == stat:
+        return cached
+    if time.time_ns() - st.st_mtime_ns < _SNAPSHOT_RACY_NS:
+        stat = None
+
+    file_entries: List[Tuple[str, int]] = []
+    subdirs: List[str] = []
+    with os.scandir(path) as entries:
+        for dir_entry in entries:
+            try:
+                if dir_entry.is_dir():
+                    if not dir_entry.is_symlink():
+                        subdirs.append(dir_entry.name)
+                    continue
+                file_entries.append((dir_entry.name, dir_entry.stat().st_size))
+            except OSError:
+                continue
+    return _SnapshotEntry(stat, file_entries, subdirs)
+
+
+def _read_snapshot(path: str, log: Log) -> _Snapshot:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as snapshot_file:
+        try:
+            snapshot_low = pickle.load(snapshot_file)
+            if snapshot_low["version"] == _SNAPSHOT_VERSION:
+                return snapshot_low["dirs"]
+        except (KeyError, ValueError, EOFError, AttributeError, pickle.UnpicklingError):
+            log.error("Can't unpickle data roots snapshot - ignored: {red}%s{reset}", (path,))
+    return {}
+
+
+def _write_snapshot(path: str, snapshot: _Snapshot) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tools.make_sub_name(path, ".", ".tmp")
+    with open(tmp_path, "wb") as snapshot_file:
+        pickle.dump({
+            "version": _SNAPSHOT_VERSION,
+            "dirs": snapshot,
+        }, snapshot_file)
+    os.replace(tmp_path, path)
@@ -19,12 +19,23 @@
 
 import os
 import fnmatch
+import contextlib
+import sqlite3
+import collections
+import concurrent.futures
 
+from typing import Tuple
 from typing import List
 from typing import Dict
+from typing import Set
+from typing import Deque
+from typing import Iterable
+from typing import Iterator
+from typing import Generator
 from typing import Optional
 from typing import Union
 
+from ..tfile import TorrentSummary
 from ..tfile import Torrent
 from ..tfile import is_torrent_hash
 
@@ -32,49 +43,378 @@ from ..cli import Log
 
 
 # =====
-def load_from_dir(path: str, name_filter: str, precalculate_hashes: bool, log: Log) -> Dict[str, Optional[Torrent]]:
-    if not log.isatty():
-        log.info("Loading torrents from {cyan}%s/{yellow}%s{reset} ...", (path, name_filter))
+class TorrentsStream:
+    def __init__(self, count: int, items: Iterable[Tuple[str, Optional[Torrent]]]) -> None:
+        self.__count = count
+        self.__items = items
 
-    torrents: Dict[str, Optional[Torrent]] = {}
-    for name in log.progress(
-        sorted(name for name in os.listdir(path) if fnmatch.fnmatch(name, name_filter)),
-        ("Loading torrents from {cyan}%s/{yellow}%s{reset}", (path, name_filter)),
-        ("Loaded {magenta}%d{reset} torrents from {cyan}%s/{yellow}%s{reset}", (lambda: len(torrents), path, name_filter)),
-    ):
-        file_path = os.path.abspath(os.path.join(path, name))
+    def __len__(self) -> int:
+        return self.__count
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[Torrent]]]:
+        return iter(self.__items)
+
+
+_INDEX_VERSION = 3
+_INDEX_LOCK_TIMEOUT = 60.0
+_INDEX_COMMIT_EVERY = 1000
+
+
+class _TorrentsIndex:
+    # One SQLite row per torrent file with its stat and a short summary, the full torrents are not stored.
+    # The rows are read and written one by one, so the index is never loaded to the memory at whole.
+    # The indexed torrents are created lazily and read their files only if the summary is not enough.
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.__conn = conn
+        self.__changes = 0
+
+    def get(self, file_path: str, stat: Tuple[int, int, int]) -> Tuple[bool, Optional[Torrent]]:
+        row = self.__conn.execute(
+            "SELECT inode, size, mtime_ns, hash, name, comment, total_size, private FROM torrents WHERE path = ?",
+            (os.fsencode(file_path),),
+        ).fetchone()
+        if row is None or tuple(row[:3]) != stat:
+            return (False, None)
+        if row[3] is None:
+            return (True, None)  # Broken torrent
+        (torrent_hash, name, comment, total_size, private) = row[3:]
+        return (True, _make_lazy_torrent(file_path, TorrentSummary(torrent_hash, name, comment, total_size, bool(private))))
+
+    def find(self, dir_path: str, name_filter: str, torrent_hash: str) -> Optional[Torrent]:
+        for (path_low, inode, size, mtime_ns, name, comment, total_size, private) in self.__conn.execute(
+            "SELECT path, inode, size, mtime_ns, name, comment, total_size, private FROM torrents WHERE hash = ? AND dir = ?",
+            (torrent_hash, os.fsencode(dir_path)),
+        ).fetchall():
+            file_path = os.fsdecode(path_low)
+            if not fnmatch.fnmatch(os.path.basename(file_path), name_filter):
+                continue
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            if (st.st_ino, st.st_size, st.st_mtime_ns) == (inode, size, mtime_ns):
+                return _make_lazy_torrent(file_path, TorrentSummary(torrent_hash, name, comment, total_size, bool(private)))
+        return None
+
+    def put(self, file_path: str, stat: Tuple[int, int, int], torrent: Optional[Torrent]) -> None:
+        summary: Tuple = ((None,) * 5 if torrent is None else tuple(torrent.get_summary()))
+        self.__conn.execute(
+            "INSERT OR REPLACE INTO torrents (path, dir, inode, size, mtime_ns, hash, name, comment, total_size, private)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (os.fsencode(file_path), os.fsencode(os.path.dirname(file_path)), *stat, *summary),
+        )
+        self.__count_change()
+
+    def remove_missing(self, dir_path: str, name_filter: str, present: Iterable[str]) -> None:
+        present = set(present)
+        for (path_low,) in self.__conn.execute(
+            "SELECT path FROM torrents WHERE dir = ?",
+            (os.fsencode(dir_path),),
+        ).fetchall():
+            file_path = os.fsdecode(path_low)
+            if file_path not in present and fnmatch.fnmatch(os.path.basename(file_path), name_filter):
+                self.__conn.execute("DELETE FROM torrents WHERE path = ?", (path_low,))
+                self.__count_change()
+
+    def commit(self) -> None:
+        self.__conn.commit()
+        self.__changes = 0
+
+    def __count_change(self) -> None:
+        # Commit from time to time to avoid holding the write lock for the whole loading
+        self.__changes += 1
+        if self.__changes >= _INDEX_COMMIT_EVERY:
+            self.commit()
+
+
+@contextlib.contextmanager
+def _open_index(path: str, log: Log) -> Generator[_TorrentsIndex, None, None]:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        conn = _open_index_db(path)
+    except sqlite3.DatabaseError:
+        log.error("Can't read torrents index - recreated: {red}%s{reset}", (path,))
+        os.remove(path)
+        conn = _open_index_db(path)
+    try:
+        index = _TorrentsIndex(conn)
         try:
-            torrents[name] = Torrent(path=file_path)
-            if precalculate_hashes:
-                torrents[name].get_hash()  # type: ignore
-        except ValueError:
-            log.error("Found broken torrent: {cyan}%s/{yellow}%s{reset}", (path, name))
-            torrents[name] = None
-        except Exception:
-            log.error("Can't process torrent: {cyan}%s/{yellow}%s{reset}", (path, name))
-            raise
+            yield index
+        finally:
+            index.commit()
+    finally:
+        conn.close()
 
-    if not log.isatty():
-        log.info("Loaded {magenta}%d{reset} torrents from {cyan}%s/{yellow}%s{reset}",
-                 (len(torrents), path, name_filter))
-    return torrents
+
+def _open_index_db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=_INDEX_LOCK_TIMEOUT, check_same_thread=False)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] != _INDEX_VERSION:
+            conn.executescript(f"""
+                DROP TABLE IF EXISTS torrents;
+                CREATE TABLE torrents (
+                    path BLOB PRIMARY KEY,
+                    dir BLOB NOT NULL,
+                    inode INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    hash TEXT,
+                    name TEXT,
+                    comment TEXT,
+                    total_size INTEGER,
+                    private INTEGER
+                );
+                CREATE INDEX torrents_dir ON torrents (dir);
+                CREATE INDEX torrents_hash ON torrents (hash);
+                PRAGMA user_version = {_INDEX_VERSION};
+            """)
+        return conn
+    except Exception:
+        conn.close()
+        raise
+
+
+def _make_lazy_torrent(file_path: str, summary: TorrentSummary) -> Torrent:
+    return Torrent(path=file_path, skip_pieces=True, use_mmap=True, summary=summary)
 
 
-def by_hash(torrents: Dict[str, Optional[Torrent]]) -> Dict[str, Torrent]:
+def iter_from_dir(  # pylint: disable=too-many-positional-arguments
+    path: str,
+    name_filter: str,
+    precalculate_hashes: bool,
+    log: Log,
+    workers: int=1,
+    use_threads: bool=False,
+    index_path: str="",
+    with_progress: bool=False,
+) -> TorrentsStream:
+
+    stats = {
+        os.path.abspath(os.path.join(path, entry.name)): _get_stat_key(entry)
+        for entry in os.scandir(path)
+        if fnmatch.fnmatch(entry.name, name_filter)
+    }
+    names = sorted(map(os.path.basename, stats))
+    stream = TorrentsStream(len(names), _iter_torrents(
+        path=path,
+        name_filter=name_filter,
+        names=names,
+        stats=stats,
+        precalculate_hashes=precalculate_hashes,
+        workers=workers,
+        use_threads=use_threads,
+        index_path=index_path,
+        log=log,
+    ))
+    if with_progress:
+        stream = TorrentsStream(len(names), _iter_with_progress(path, name_filter, stream, log))
+    return stream
+
+
+def find_by_hashes(
+    path: str,
+    name_filter: str,
+    hashes: Iterable[str],
+    log: Log,
+    index_path: str="",
+) -> Dict[str, Torrent]:
+
+    # For a few hashes: the unchanged indexed torrent files are taken right from the index,
+    # the others are searched in the whole directory (and are indexed on the way).
+    # The missing hashes are not in the result.
+    wanted = set(hashes)
+    found: Dict[str, Torrent] = {}
+    if index_path and os.path.exists(index_path):
+        with _open_index(index_path, log) as index:
+            for torrent_hash in wanted:
+                torrent = index.find(os.path.abspath(path), name_filter, torrent_hash)
+                if torrent is not None:
+                    found[torrent_hash] = torrent
+    if len(found) != len(wanted):
+        for (_, torrent) in iter_from_dir(path, name_filter, True, log, index_path=index_path):
+            if torrent is not None and torrent.get_hash() in wanted:
+                found.setdefault(torrent.get_hash(), torrent)
+    return found
+
+
+def by_hash(torrents: Iterable[Tuple[str, Optional[Torrent]]]) -> Dict[str, Torrent]:
     return {
         torrent.get_hash(): torrent
-        for torrent in filter(None, torrents.values())
+        for (_, torrent) in torrents
+        if torrent is not None
     }
 
 
-def by_hash_with_dups(torrents: Dict[str, Optional[Torrent]]) -> Dict[str, List[Torrent]]:
+def by_hash_with_dups(torrents: Iterable[Tuple[str, Optional[Torrent]]]) -> Dict[str, List[Torrent]]:
     with_dups: Dict[str, List[Torrent]] = {}  # noqa: E701
-    for torrent in filter(None, torrents.values()):
-        with_dups.setdefault(torrent.get_hash(), [])
-        with_dups[torrent.get_hash()].append(torrent)
+    for (_, torrent) in torrents:
+        if torrent is not None:
+            with_dups.setdefault(torrent.get_hash(), [])
+            with_dups[torrent.get_hash()].append(torrent)
     return with_dups
 
 
+def _iter_with_progress(
+    path: str,
+    name_filter: str,
+    stream: TorrentsStream,
+    log: Log,
+) -> Generator[Tuple[str, Optional[Torrent]], None, None]:
+
+    if not log.isatty():
+        log.info("Loading torrents from {cyan}%s/{yellow}%s{reset} ...", (path, name_filter))
+
+    count = 0
+    for item in log.progress(
+        stream,
+        ("Loading torrents from {cyan}%s/{yellow}%s{reset}", (path, name_filter)),
+        ("Loaded {magenta}%d{reset} torrents from {cyan}%s/{yellow}%s{reset}", (lambda: count, path, name_filter)),
+    ):
+        count += 1
+        yield item
+
+    if not log.isatty():
+        log.info("Loaded {magenta}%d{reset} torrents from {cyan}%s/{yellow}%s{reset}",
+                 (count, path, name_filter))
+
+
+def _iter_torrents(  # pylint: disable=too-many-positional-arguments
+    path: str,
+    name_filter: str,
+    names: List[str],
+    stats: Dict[str, Optional[Tuple[int, int, int]]],
+    precalculate_hashes: bool,
+    workers: int,
+    use_threads: bool,
+    index_path: str,
+    log: Log,
+) -> Generator[Tuple[str, Optional[Torrent]], None, None]:
+
+    if not index_path:
+        yield from _iter_torrents_from(path, names, stats, precalculate_hashes, workers, use_threads, None, log)
+    else:
+        with _open_index(index_path, log) as index:
+            index.remove_missing(os.path.abspath(path), name_filter, stats)
+            yield from _iter_torrents_from(path, names, stats, True, workers, use_threads, index, log)
+
+
+def _iter_torrents_from(  # pylint: disable=too-many-positional-arguments,too-many-locals
+    path: str,
+    names: List[str],
+    stats: Dict[str, Optional[Tuple[int, int, int]]],
+    precalculate_hashes: bool,
+    workers: int,
+    use_threads: bool,
+    index: Optional[_TorrentsIndex],
+    log: Log,
+) -> Generator[Tuple[str, Optional[Torrent]], None, None]:
+
+    indexed: Set[str] = set()
+    not_indexed: List[str] = []
+    for name in names:
+        file_path = os.path.abspath(os.path.join(path, name))
+        stat = stats[file_path]
+        if index is not None and stat is not None:
+            if index.get(file_path, stat)[0]:
+                indexed.add(name)  # Will be read again on yield, so the torrents are not kept here
+                continue
+        not_indexed.append(file_path)
+    loaded = _iter_loaded(not_indexed, precalculate_hashes, workers, use_threads)
+
+    for name in names:
+        file_path = os.path.abspath(os.path.join(path, name))
+        torrent: Optional[Torrent]
+        if name in indexed:
+            assert index is not None
+            stat = stats[file_path]
+            assert stat is not None
+            (found, torrent) = index.get(file_path, stat)
+            if not found:  # Removed by the parallel process
+                torrent = _load_torrent(file_path, True)
+        else:
+            try:
+                torrent = next(loaded)  # pylint: disable=stop-iteration-return
+            except Exception:
+                log.error("Can't process torrent: {cyan}%s/{yellow}%s{reset}", (path, name))
+                raise
+            stat = stats[file_path]
+            if index is not None and stat is not None:
+                index.put(file_path, stat, torrent)
+        if torrent is None:
+            log.error("Found broken torrent: {cyan}%s/{yellow}%s{reset}", (path, name))
+        yield (name, torrent)
+
+
+def _get_stat_key(entry: os.DirEntry) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = entry.stat()
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _iter_loaded(
+    file_paths: List[str],
+    precalculate_hashes: bool,
+    workers: int,
+    use_threads: bool,
+) -> Iterator[Optional[Torrent]]:
+
+    if workers <= 0:
+        workers = (os.cpu_count() or 1)
+    if workers == 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield _load_torrent(file_path, precalculate_hashes)
+    else:
+        # The workers send back the parsed torrents without the raw data and the piece hashes,
+        # so the results are small and cheap to unpickle. Only a few chunks are loaded ahead
+        # to keep the memory bounded while the consumer is busy with the network.
+        # The threads have no pickling at all, the chunk is decoded and hashed without the GIL.
+        chunk_size = max(1, min(len(file_paths) // (workers * 4), 64))
+        executor_cls = (concurrent.futures.ThreadPoolExecutor if use_threads else concurrent.futures.ProcessPoolExecutor)
+        with executor_cls(workers) as executor:
+            pending: Deque[concurrent.futures.Future] = collections.deque()
+            for index in range(0, len(file_paths), chunk_size):
+                pending.append(executor.submit(_load_chunk, file_paths[index:index + chunk_size], precalculate_hashes))
+                if len(pending) >= workers * 2:
+                    yield from _unpack_chunk(pending.popleft().result())
+            while pending:
+                yield from _unpack_chunk(pending.popleft().result())
+
+
+def _load_chunk(file_paths: List[str], precalculate_hashes: bool) -> List[Union[Torrent, None, Exception]]:
+    try:
+        return list(Torrent.load_many_from_files(file_paths, skip_pieces=True, precalculate_hashes=precalculate_hashes))
+    except Exception:
+        pass  # Find the failed torrent one by one
+
+    results: List[Union[Torrent, None, Exception]] = []
+    for file_path in file_paths:
+        try:
+            results.append(_load_torrent(file_path, precalculate_hashes))
+        except Exception as err:
+            results.append(err)  # Will be raised for the exact torrent by the parent
+    return results
+
+
+def _unpack_chunk(results: List[Union[Torrent, None, Exception]]) -> Generator[Optional[Torrent], None, None]:
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+        yield result
+
+
+def _load_torrent(file_path: str, precalculate_hashes: bool) -> Optional[Torrent]:
+    try:
+        torrent = Torrent(path=file_path, skip_pieces=True, use_mmap=True)
+        if precalculate_hashes:
+            torrent.get_hash()
+        return torrent
+    except ValueError:
+        return None
+
+
 # =====
 def find_torrents(path: str, items: str) -> List[Torrent]:
     return [_find_torrent_or_hash(path, item, False) for item in items]  # type: ignore
@@ -25,9 +25,10 @@ from typing import Dict
 from typing import Callable
 from typing import Union
 from typing import Type
+from typing import NamedTuple
 from typing import Any
 
-from ...tfile import TorrentEntryAttrs
+from ...tfile import FileTree
 from ...tfile import Torrent
 
 from .. import BasePlugin
@@ -58,17 +59,13 @@ def check_torrent_accessible(method: Callable) -> Callable:
     return wrap
 
 
-def build_files(prefix: str, flist: List[Tuple[str, int]]) -> Dict[str, TorrentEntryAttrs]:
-    files: Dict[str, TorrentEntryAttrs] = {}
-    for (path, size) in flist:
-        path_list = path.split(os.path.sep)
-        name = None
-        for index in range(len(path_list)):
-            name = os.path.join(prefix, os.path.sep.join(path_list[0:index + 1]))
-            files[name] = TorrentEntryAttrs.dir()
-        assert name is not None
-        files[name] = TorrentEntryAttrs.file(size)
-    return files
+def build_files(prefix: str, flist: List[Tuple[str, int]]) -> FileTree:
+    return FileTree(prefix, ((path.split(os.path.sep), size) for (path, size) in flist))
+
+
+class TorrentFiles(NamedTuple):
+    prefix: str
+    files: FileTree
 
 
 class BaseClient(BasePlugin):
@@ -116,9 +113,35 @@ class BaseClient(BasePlugin):
         raise NotImplementedError
 
     @hash_or_torrent
-    def get_files(self, torrent_hash: str) -> Dict[str, TorrentEntryAttrs]:
+    def get_files(self, torrent_hash: str) -> FileTree:
         raise NotImplementedError
 
+    # =====
+
+    def get_data_prefixes(self, torrent_hashes: List[str]) -> Dict[str, str]:
+        # The batch get_data_prefix(), the unknown hashes are skipped.
+        # The plugins override it to make as few requests as the client allows.
+        prefixes: Dict[str, str] = {}
+        for torrent_hash in torrent_hashes:
+            try:
+                prefixes[torrent_hash] = self.get_data_prefix(torrent_hash)
+            except NoSuchTorrentError:
+                pass
+        return prefixes
+
+    def get_files_many(self, torrent_hashes: List[str]) -> Dict[str, TorrentFiles]:
+        # Same for get_data_prefix() + get_files()
+        result: Dict[str, TorrentFiles] = {}
+        for torrent_hash in torrent_hashes:
+            try:
+                result[torrent_hash] = TorrentFiles(
+                    prefix=self.get_data_prefix(torrent_hash),
+                    files=self.get_files(torrent_hash),
+                )
+            except NoSuchTorrentError:
+                pass
+        return result
+
 
 class WithCustoms(BaseClient):
     def __init__(self, **_: Any) -> None:  # pylint: disable=super-init-not-called
@@ -25,7 +25,7 @@ from typing import Any
 
 from ...optconf import Option
 
-from ...tfile import TorrentEntryAttrs
+from ...tfile import FileTree
 from ...tfile import Torrent
 
 from . import BaseClient
@@ -116,7 +116,7 @@ class Plugin(BaseClient):
         return str(self.__get_torrent_obj(torrent_hash).name())
 
     @hash_or_torrent
-    def get_files(self, torrent_hash: str) -> Dict[str, TorrentEntryAttrs]:
+    def get_files(self, torrent_hash: str) -> FileTree:
         torrent_obj = self.__get_torrent_obj(torrent_hash)
         count = torrent_obj.numFiles()
         name = str(torrent_obj.name())
@@ -21,6 +21,7 @@ import os
 import urllib.parse
 import urllib.error
 import http.cookiejar
+import concurrent.futures
 import json
 
 from typing import List
@@ -31,18 +32,23 @@ from typing import Any
 from ...optconf import Option
 from ...optconf import SecretOption
 
-from ...tfile import TorrentEntryAttrs
+from ...tfile import FileTree
 from ...tfile import Torrent
 
 from ... import web
 
 from . import BaseClient
+from . import TorrentFiles
 from . import NoSuchTorrentError
 from . import hash_or_torrent
 from . import check_torrent_accessible
 from . import build_files
 
 
+# =====
+_FILES_REQUESTS = 8  # WebUI has no batch method for the files, so we send them concurrently
+
+
 # =====
 class Plugin(BaseClient):
     # API description: https://github.com/qbittorrent/qBittorrent/wiki/WebUI-API-(qBittorrent-v3.2.0-v4.0.4)
@@ -156,7 +162,7 @@ class Plugin(BaseClient):
         return self.__get_torrent_props(torrent_hash)["name"]
 
     @hash_or_torrent
-    def get_files(self, torrent_hash: str) -> Dict[str, TorrentEntryAttrs]:
+    def get_files(self, torrent_hash: str) -> FileTree:
         try:
             return build_files("", [
                 (item["name"], item["size"])
@@ -169,6 +175,38 @@ class Plugin(BaseClient):
 
     # =====
 
+    def get_data_prefixes(self, torrent_hashes: List[str]) -> Dict[str, str]:
+        return {
+            torrent_hash: props["save_path"]
+            for (torrent_hash, props) in self.__get_torrents_props(torrent_hashes).items()
+        }
+
+    def get_files_many(self, torrent_hashes: List[str]) -> Dict[str, TorrentFiles]:
+        props = self.__get_torrents_props(torrent_hashes)
+
+        def get_files(torrent_hash: str) -> Optional[FileTree]:
+            try:
+                return self.get_files(torrent_hash)
+            except NoSuchTorrentError:
+                return None  # Removed between the requests
+
+        with concurrent.futures.ThreadPoolExecutor(_FILES_REQUESTS) as executor:
+            return {
+                torrent_hash: TorrentFiles(props[torrent_hash]["save_path"], files)
+                for (torrent_hash, files) in zip(props, executor.map(get_files, props))
+                if files is not None
+            }
+
+    # =====
+
+    def __get_torrents_props(self, torrent_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        if len(torrent_hashes) == 0:
+            return {}
+        return {
+            props["hash"].lower(): props
+            for props in json.loads(self.__get("/query/torrents?hashes=" + "|".join(torrent_hashes)))
+        }
+
     def __get_torrent_props(self, torrent_hash: str) -> Dict[str, Any]:
         result = json.loads(self.__get(f"/query/torrents?hashes={torrent_hash}"))
         assert len(result) >= 0, (torrent_hash, result)
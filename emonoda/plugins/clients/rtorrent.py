@@ -21,6 +21,7 @@ import os
 import ssl
 import xmlrpc.client
 import time
+import itertools
 
 from typing import List
 from typing import Dict
@@ -29,10 +30,11 @@ from typing import Any
 
 from ...optconf import Option
 
-from ...tfile import TorrentEntryAttrs
+from ...tfile import FileTree
 from ...tfile import Torrent
 
 from . import WithCustoms
+from . import TorrentFiles
 from . import NoSuchTorrentError
 from . import hash_or_torrent
 from . import check_torrent_accessible
@@ -54,6 +56,21 @@ def _catch_unknown_torrent(method: Callable) -> Callable:
     return wrap
 
 
+def _make_data_prefix(path: str, is_multi_file: int) -> str:
+    if is_multi_file:
+        return os.path.dirname(os.path.normpath(path))
+    return path
+
+
+def _make_files(base_file_name: str, is_multi_file: int, flist: List[List]) -> FileTree:
+    if not is_multi_file:
+        return build_files("", [(base_file_name, flist[0][1])])
+    return FileTree("", itertools.chain([([base_file_name], None)], (
+        ([base_file_name] + path.split(os.path.sep), size)
+        for (path, size) in flist
+    )))
+
+
 # =====
 class Plugin(WithCustoms):
     # API description: http://code.google.com/p/gi-torrent/wiki/rTorrent_XMLRPC_reference
@@ -149,10 +166,7 @@ class Plugin(WithCustoms):
         mc = xmlrpc.client.MultiCall(self.__server)
         mc.d.directory(torrent_hash)
         mc.d.is_multi_file(torrent_hash)
-        (path, is_multi_file) = mc()  # type: ignore
-        if is_multi_file:  # type: ignore
-            path = os.path.dirname(os.path.normpath(path))  # type: ignore
-        return path
+        return _make_data_prefix(*mc())  # type: ignore
 
     def get_data_prefix_default(self) -> str:
         return self.__server.directory.default()  # type: ignore
@@ -178,27 +192,51 @@ class Plugin(WithCustoms):
 
     @hash_or_torrent
     @_catch_unknown_torrent
-    def get_files(self, torrent_hash: str) -> Dict[str, TorrentEntryAttrs]:
+    def get_files(self, torrent_hash: str) -> FileTree:
         mc = xmlrpc.client.MultiCall(self.__server)
         mc.d.base_filename(torrent_hash)
         mc.d.is_multi_file(torrent_hash)
-        mc.d.size_files(torrent_hash)
-        mc.f.size_bytes(torrent_hash, 0)
-        (base_file_name, is_multi_file, count, first_file_size) = tuple(mc())  # type: ignore
+        mc.f.multicall(torrent_hash, "", "f.path=", "f.size_bytes=")
+        return _make_files(*mc())  # type: ignore
+
+    # =====
 
-        if not is_multi_file:
-            return {base_file_name: TorrentEntryAttrs.file(first_file_size)}
+    def get_data_prefixes(self, torrent_hashes: List[str]) -> Dict[str, str]:
+        mc = xmlrpc.client.MultiCall(self.__server)
+        for torrent_hash in torrent_hashes:
+            mc.d.directory(torrent_hash)
+            mc.d.is_multi_file(torrent_hash)
+        results: Any = mc()
+        prefixes: Dict[str, str] = {}
+        for (index, torrent_hash) in enumerate(torrent_hashes):
+            try:
+                prefixes[torrent_hash] = _make_data_prefix(results[index * 2], results[index * 2 + 1])
+            except xmlrpc.client.Fault as err:
+                if err.faultCode != _XMLRPC_UNKNOWN_HASH:
+                    raise
+        return prefixes
 
+    def get_files_many(self, torrent_hashes: List[str]) -> Dict[str, TorrentFiles]:
+        # All calls for all hashes in the single request, f.multicall gives the whole file list at once
         mc = xmlrpc.client.MultiCall(self.__server)
-        for index in range(count):
-            mc.f.path(torrent_hash, index)
-            mc.f.size_bytes(torrent_hash, index)
-        flist = list(mc())  # type: ignore
-        flist = list(zip(flist[::2], flist[1::2]))
-
-        files = build_files(base_file_name, flist)
-        files.update({base_file_name: TorrentEntryAttrs.dir()})
-        return files
+        for torrent_hash in torrent_hashes:
+            mc.d.directory(torrent_hash)
+            mc.d.base_filename(torrent_hash)
+            mc.d.is_multi_file(torrent_hash)
+            mc.f.multicall(torrent_hash, "", "f.path=", "f.size_bytes=")
+        results: Any = mc()
+        result: Dict[str, TorrentFiles] = {}
+        for (index, torrent_hash) in enumerate(torrent_hashes):
+            try:
+                (path, base_file_name, is_multi_file, flist) = [results[index * 4 + offset] for offset in range(4)]
+                result[torrent_hash] = TorrentFiles(
+                    prefix=_make_data_prefix(path, is_multi_file),
+                    files=_make_files(base_file_name, is_multi_file, flist),
+                )
+            except xmlrpc.client.Fault as err:
+                if err.faultCode != _XMLRPC_UNKNOWN_HASH:
+                    raise
+        return result
 
     # =====
 
@@ -28,10 +28,11 @@ from typing import Any
 from ...optconf import Option
 from ...optconf import SecretOption
 
-from ...tfile import TorrentEntryAttrs
+from ...tfile import FileTree
 from ...tfile import Torrent
 
 from . import BaseClient
+from . import TorrentFiles
 from . import NoSuchTorrentError
 from . import hash_or_torrent
 from . import check_torrent_accessible
@@ -50,6 +51,18 @@ else:
     transmissionrpc.project = "original"
 
 
+# =====
+def _make_files(files: Any) -> FileTree:
+    flist = ([
+        (item["name"], item["size"])
+        for item in files.values()
+    ] if transmissionrpc.project == "original" else [
+        (item.name, item.size)
+        for item in files
+    ])
+    return build_files("", flist)
+
+
 # =====
 class Plugin(BaseClient):
     # API description:
@@ -157,18 +170,38 @@ class Plugin(BaseClient):
         return self.__get_torrent_prop(torrent_hash, "name")
 
     @hash_or_torrent
-    def get_files(self, torrent_hash: str) -> Dict[str, TorrentEntryAttrs]:
-        flist = ([
-            (item["name"], item["size"])
-            for item in self.__get_files(torrent_hash).values()
-        ] if transmissionrpc.project == "original" else [
-            (item.name, item.size)
-            for item in self.__get_files(torrent_hash)
-        ])
-        return build_files("", flist)
+    def get_files(self, torrent_hash: str) -> FileTree:
+        return _make_files(self.__get_files(torrent_hash))
 
     # =====
 
+    def get_data_prefixes(self, torrent_hashes: List[str]) -> Dict[str, str]:
+        if len(torrent_hashes) == 0:
+            return {}  # Empty ids means all torrents
+        return {
+            str(torrent_obj.hashString).lower(): torrent_obj.downloadDir
+            for torrent_obj in self._client.get_torrents(torrent_hashes, arguments=["id", "hashString", "downloadDir"])
+        }
+
+    def get_files_many(self, torrent_hashes: List[str]) -> Dict[str, TorrentFiles]:
+        # Two requests for the whole batch: the file lists are keyed by the torrent ids
+        if len(torrent_hashes) == 0:
+            return {}
+        torrent_objs = {
+            torrent_obj.id: torrent_obj
+            for torrent_obj in self._client.get_torrents(torrent_hashes, arguments=["id", "hashString", "downloadDir"])
+        }
+        if len(torrent_objs) == 0:
+            return {}
+        return {
+            str(torrent_objs[torrent_id].hashString).lower(): TorrentFiles(
+                prefix=torrent_objs[torrent_id].downloadDir,
+                files=_make_files(files),
+            )
+            for (torrent_id, files) in self._client.get_files(list(torrent_objs)).items()
+            if torrent_id in torrent_objs and len(files) > 0
+        }
+
     def __get_torrent_prop(self, torrent_hash: str, prop: str) -> Any:
         return getattr(self.__get_torrent_obj(torrent_hash, [prop]), prop)
 
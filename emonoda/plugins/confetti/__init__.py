@@ -109,7 +109,7 @@ class BaseConfetti(BasePlugin):
         return mako.template.Template(template).render(**kwargs).strip()
 
 
-class WithWeb(BaseConfetti):  # pylint: disable=abstract-method
+class WithWeb(BaseConfetti):  # pylint: disable=abstract-method,too-many-instance-attributes
     _SITE_RETRY_CODES: List[int] = []
 
     def __init__(  # pylint: disable=super-init-not-called,too-many-positional-arguments
@@ -117,6 +117,8 @@ class WithWeb(BaseConfetti):  # pylint: disable=abstract-method
         timeout: float,
         retries: int,
         retries_sleep: float,
+        retries_max_sleep: float,
+        rate_limit: float,
         user_agent: str,
         proxy_url: str,
         **_: Any,
@@ -125,6 +127,8 @@ class WithWeb(BaseConfetti):  # pylint: disable=abstract-method
         self.__timeout = timeout
         self.__retries = retries
         self.__retries_sleep = retries_sleep
+        self.__retries_max_sleep = retries_max_sleep
+        self.__limiter = web.RateLimiter(rate_limit)
         self.__user_agent = user_agent
         self.__proxy_url = proxy_url
 
@@ -136,6 +140,8 @@ class WithWeb(BaseConfetti):  # pylint: disable=abstract-method
             "timeout":       Option(default=10.0, help="Network timeout"),
             "retries":       Option(default=5, help="Retries for failed attempts"),
             "retries_sleep": Option(default=1.0, help="Sleep interval between failed attempts"),
+            "retries_max_sleep": Option(default=10.0, help="Double the sleep interval after each attempt up to this value"),
+            "rate_limit":    Option(default=1.0, help="Max requests per second to the endpoint (0 - unlimited)"),
             "user_agent":    Option(default="Mozilla/5.0", help="User-Agent for site"),
             "proxy_url":     Option(default="", help="URL of HTTP/SOCKS4/SOCKS5 proxy"),
         }
@@ -163,6 +169,8 @@ class WithWeb(BaseConfetti):  # pylint: disable=abstract-method
             retries=self.__retries,
             retries_sleep=self.__retries_sleep,
             retry_codes=self._SITE_RETRY_CODES,
+            retries_max_sleep=self.__retries_max_sleep,
+            limiter=self.__limiter,
         )
 
 
@@ -19,6 +19,8 @@
 
 import re
 import socket
+import threading
+import time
 import urllib.request
 import urllib.parse
 import urllib.error
@@ -27,11 +29,13 @@ import http.cookiejar
 import json
 import datetime
 
+from typing import List
 from typing import Dict
 from typing import Pattern
 from typing import Match
 from typing import Callable
 from typing import NamedTuple
+from typing import Union
 from typing import Optional
 from typing import Type
 from typing import Any
@@ -47,6 +51,8 @@ from ...tfile import decode_torrent_data
 
 from ... import web
 
+from ...web import aioopener
+
 from .. import BasePlugin
 from .. import get_classes
 
@@ -73,7 +79,51 @@ class NetworkError(TrackerError):
         return f"{type(self._sub).__name__}: {self._sub}"
 
 
+class UnavailableError(TrackerError):
+    pass
+
+
 # =====
+class _CircuitBreaker:
+    # Counts the consecutive network errors and fails the requests immediately after the threshold.
+    # A single request is allowed once in the interval to check if the site is back.
+
+    def __init__(self, threshold: int, interval: float) -> None:
+        self.__threshold = threshold
+        self.__interval = interval
+
+        self.__lock = threading.Lock()
+        self.__errors = 0
+        self.__opened_at: Optional[float] = None
+        self.__probing = False
+
+    def check(self) -> bool:
+        # Returns True for the probe, its report() must be called with probe=True
+        with self.__lock:
+            if self.__opened_at is None:
+                return False
+            wait = self.__opened_at + self.__interval - time.monotonic()
+            if wait > 0 or self.__probing:
+                raise UnavailableError(
+                    f"The site is considered unavailable after {self.__errors} network errors in a row,"
+                    f" the next try in {max(wait, 0):.0f} seconds"
+                )
+            self.__probing = True
+            return True
+
+    def report(self, ok: bool, probe: bool) -> None:
+        with self.__lock:
+            if probe:
+                self.__probing = False
+            if ok:
+                self.__errors = 0
+                self.__opened_at = None
+            else:
+                self.__errors += 1
+                if 0 < self.__threshold <= self.__errors:
+                    self.__opened_at = time.monotonic()
+
+
 def _assert(exception: Type[TrackerError], arg: Any, msg: str="") -> None:
     if not arg:
         raise exception(msg)
@@ -82,22 +132,28 @@ def _assert(exception: Type[TrackerError], arg: Any, msg: str="") -> None:
 class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
     _SITE_VERSION = 0
     _SITE_ENCODING = "utf-8"
-    _SITE_RETRY_CODES = [500, 502, 503]
+    _SITE_RETRY_CODES = [429, 500, 502, 503]
 
     _SITE_FINGERPRINT_URL = __D_SITE_FINGERPRINT_URL = ""
     _SITE_FINGERPRINT_TEXT = __D_SITE_FINGERPRINT_TEXT = ""
 
     _COMMENT_REGEXP = __D_COMMENT_REGEXP = re.compile(r"(?P<torrent_id>.*)")
 
-    def __init__(  # pylint: disable=super-init-not-called,too-many-positional-arguments
+    def __init__(  # pylint: disable=super-init-not-called,too-many-positional-arguments,too-many-arguments
         self,
         timeout: float,
         retries: int,
         retries_sleep: float,
+        retries_max_sleep: float,
+        rate_limit: float,
         user_agent: str,
         proxy_url: str,
+        transport: str,
         check_version: bool,
         check_fingerprint: bool,
+        concurrency: int,
+        breaker_threshold: int,
+        breaker_interval: float,
         **_: Any,
     ) -> None:
 
@@ -109,26 +165,44 @@ class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
         self.__timeout = timeout
         self.__retries = retries
         self.__retries_sleep = retries_sleep
+        self.__retries_max_sleep = retries_max_sleep
+        self.__limiter = web.RateLimiter(rate_limit)
         self.__user_agent = user_agent
         self.__proxy_url = proxy_url
+        self.__transport = transport
         self.__check_version = check_version
         self.__check_fingerprint = check_fingerprint
+        self.__concurrency = concurrency
+        self.__breaker = _CircuitBreaker(breaker_threshold, breaker_interval)
+
+        if transport not in ["urllib", "asyncio"]:
+            raise RuntimeError(f"Invalid HTTP transport: {transport}")
 
-        self.__opener: Optional[urllib.request.OpenerDirector] = None
+        self.__opener: Optional[Union[urllib.request.OpenerDirector, aioopener.AsyncOpener]] = None
 
         self.__cookie_jar: Optional[http.cookiejar.CookieJar] = None
 
+        # emupdate calls the tracker from the threads, so the requests depending
+        # on the cookies from _set_cookie() must hold it to not mix them up
+        self._cookies_lock = threading.Lock()
+
     @classmethod
     def get_options(cls) -> Dict[str, Option]:
         return {
             "timeout":           Option(default=10.0, help="Timeout for HTTP client"),
             "retries":           Option(default=20, help="The number of retries to handle tracker-specific HTTP errors"),
             "retries_sleep":     Option(default=1.0, help="Sleep interval between failed retries"),
+            "retries_max_sleep": Option(default=10.0, help="Double the sleep interval after each retry up to this value"),
+            "rate_limit":        Option(default=5.0, help="Max requests per second to the site (0 - unlimited)"),
             "user_agent":        Option(default="Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)"
                                                 " Chrome/88.0.4324.150 Safari/537.36", help="User-Agent for site"),
             "proxy_url":         Option(default="", help="URL of HTTP/SOCKS4/SOCKS5 proxy"),
+            "transport":         Option(default="urllib", help="HTTP transport for site: urllib or asyncio"),
             "check_fingerprint": Option(default=True, help="Check the site fingerprint"),
             "check_version":     Option(default=True, help="Check the tracker version from GitHub"),
+            "concurrency":       Option(default=2, help="The number of torrents to check on the site concurrently"),
+            "breaker_threshold": Option(default=3, help="Consider the site unavailable after this number of network errors in a row (0 - disabled)"),
+            "breaker_interval":  Option(default=60.0, help="Interval between the tries of unavailable site"),
         }
 
     def test(self) -> None:
@@ -140,6 +214,9 @@ class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
             if self.__check_version:
                 self.__test_version(info["version"])
 
+    def get_concurrency(self) -> int:
+        return max(self.__concurrency, 1)
+
     def is_matched_for(self, torrent: Torrent) -> bool:
         return (self._COMMENT_REGEXP.match(torrent.get_comment()) is not None)
 
@@ -163,9 +240,10 @@ class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
         assert not self.__opener
         if with_cookies:
             self.__cookie_jar = http.cookiejar.CookieJar()
-            self.__opener = web.build_opener(self.__proxy_url, self.__cookie_jar)
+        if self.__transport == "asyncio":
+            self.__opener = aioopener.AsyncOpener(self.__proxy_url, self.__cookie_jar)
         else:
-            self.__opener = web.build_opener(self.__proxy_url)
+            self.__opener = web.build_opener(self.__proxy_url, self.__cookie_jar)
 
     def _set_cookie(self, name: str, value: str, **kwargs: Any) -> None:
         assert self.__cookie_jar is not None
@@ -193,11 +271,17 @@ class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
             **params,  # type: ignore
         ))
 
-    def _read_url(self, *args: Any, **kwargs: Any) -> bytes:
+    def _read_url(self, *args: Any, breaker: Optional[_CircuitBreaker]=None, **kwargs: Any) -> bytes:
+        # The separate breaker is for the other host, so its failures don't stop the requests to the site
         if not kwargs.get("opener"):
             kwargs["opener"] = self.__opener
+        if breaker is None:
+            breaker = self.__breaker
+        probe = breaker.check()
+        ok = False
         try:
-            return self.__read_url_nofe(*args, **kwargs)
+            data = self.__read_url_nofe(*args, **kwargs)
+            ok = True
         except (
             socket.timeout,
             urllib.error.HTTPError,
@@ -206,7 +290,17 @@ class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
             http.client.BadStatusLine,
             ConnectionResetError,
         ) as err:
+            # The site is alive if it answers with the regular client error
+            ok = (
+                isinstance(err, urllib.error.HTTPError)
+                and err.code < 500
+                and err.code not in self._SITE_RETRY_CODES
+            )
             raise NetworkError(err)
+        finally:
+            # Any other exception is counted as a failure too, otherwise the probe would never end
+            breaker.report(ok, probe)
+        return data
 
     def __read_url_nofe(
         self,
@@ -214,7 +308,7 @@ class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
         *,
         data: Optional[bytes]=None,
         headers: Optional[Dict[str, str]]=None,
-        opener: Optional[urllib.request.OpenerDirector]=None,
+        opener: Optional[Union[urllib.request.OpenerDirector, aioopener.AsyncOpener]]=None,
     ) -> bytes:
 
         assert opener
@@ -229,6 +323,8 @@ class BaseTracker(BasePlugin):  # pylint: disable=too-many-instance-attributes
             retries=self.__retries,
             retries_sleep=self.__retries_sleep,
             retry_codes=self._SITE_RETRY_CODES,
+            retries_max_sleep=self.__retries_max_sleep,
+            limiter=self.__limiter,
         )
 
     # =====
@@ -358,6 +454,53 @@ class WithCheckHash(BaseTracker):  # pylint: disable=abstract-method
         ).group("torrent_hash").strip().lower()
 
 
+class WithBatchCheckHash(WithCheckHash):
+    # The site API returns the hashes of many torrents by one request. emupdate calls prefetch_hashes()
+    # for the groups of torrents, and fetch_hash() takes the result from there without the page.
+    # If the API fails, the torrents of the batch are checked by their pages.
+    _BATCH_HASH_URL = __D_BATCH_HASH_URL = "{torrent_ids}"
+    _BATCH_HASH_SIZE = 100
+
+    def __init__(  # pylint: disable=super-init-not-called
+        self,
+        breaker_threshold: int,
+        breaker_interval: float,
+        **_: Any,
+    ) -> None:
+
+        assert self._BATCH_HASH_URL != self.__D_BATCH_HASH_URL
+
+        self.__breaker = _CircuitBreaker(breaker_threshold, breaker_interval)
+        self.__prefetched: Dict[str, Optional[str]] = {}
+
+    def get_batch_size(self) -> int:
+        return self._BATCH_HASH_SIZE
+
+    def prefetch_hashes(self, torrents: List[Torrent]) -> None:
+        torrent_ids = sorted(set(map(self._assert_match, torrents)))
+        for index in range(0, len(torrent_ids), self._BATCH_HASH_SIZE):
+            batch = torrent_ids[index:index + self._BATCH_HASH_SIZE]
+            try:
+                self.__prefetched.update(self._parse_batch_hashes(self._read_url(
+                    self._BATCH_HASH_URL.format(torrent_ids=",".join(batch)),
+                    breaker=self.__breaker,
+                )))
+            except TrackerError:
+                pass  # Not prefetched, so fetch_hash() will go to the pages
+
+    def fetch_hash(self, torrent: Torrent) -> str:
+        torrent_id = self._assert_match(torrent)
+        if torrent_id not in self.__prefetched:
+            return super().fetch_hash(torrent)  # Was not requested or was not returned by the API
+        torrent_hash = self.__prefetched[torrent_id]
+        self._assert_logic(torrent_hash is not None, "Hash not found")
+        return torrent_hash.strip().lower()  # type: ignore
+
+    def _parse_batch_hashes(self, data: bytes) -> Dict[str, Optional[str]]:
+        # {torrent_id: hash}, None for the unknown torrents
+        raise NotImplementedError
+
+
 class WithCheckScrape(BaseTracker):  # pylint: disable=abstract-method
     _TORRENT_SCRAPE_URL = __D_TORRENT_SCRAPE_URL = "{scrape_hash}"
 
@@ -64,16 +64,17 @@ class Plugin(WithLogin, WithCheckHash):
             msg="Torrent-ID not found",
         ).group(1)
 
-        self._set_cookie("bb_dl", torrent_id)
-
-        return self._assert_valid_data(self._read_url(
-            url=f"http://pravtor.ru/download.php?id={dl_id}",
-            data=b"",
-            headers={
-                "Referer": f"http://pravtor.ru/viewtopic.php?t={torrent_id}",
-                "Origin":  "http://pravtor.ru",
-            }
-        ))
+        with self._cookies_lock:
+            self._set_cookie("bb_dl", torrent_id)
+
+            return self._assert_valid_data(self._read_url(
+                url=f"http://pravtor.ru/download.php?id={dl_id}",
+                data=b"",
+                headers={
+                    "Referer": f"http://pravtor.ru/viewtopic.php?t={torrent_id}",
+                    "Origin":  "http://pravtor.ru",
+                }
+            ))
 
     def login(self) -> None:
         self._login_using_post(
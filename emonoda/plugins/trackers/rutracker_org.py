@@ -18,8 +18,10 @@
 
 
 import re
+import json
 
 from typing import Dict
+from typing import Optional
 from typing import Any
 
 from ...optconf import Option
@@ -28,20 +30,20 @@ from ...tfile import Torrent
 
 from . import WithLogin
 from . import WithCaptcha
-from . import WithCheckHash
+from . import WithBatchCheckHash
 from . import WithStat
 
 
 # =====
-class Plugin(WithLogin, WithCaptcha, WithCheckHash, WithStat):
+class Plugin(WithLogin, WithCaptcha, WithBatchCheckHash, WithStat):
     PLUGIN_NAMES = [
         "rutracker.org",
         "torrents.ru",
     ]
 
-    _SITE_VERSION = 8
+    _SITE_VERSION = 9
     _SITE_ENCODING = "cp1251"
-    _SITE_RETRY_CODES = [503, 404]
+    _SITE_RETRY_CODES = [429, 503, 404]
 
     _SITE_FINGERPRINT_URL = "https://rutracker.org/forum/index.php"
     _SITE_FINGERPRINT_TEXT = ("<link rel=\"search\" type=\"application/opensearchdescription+xml\""
@@ -53,6 +55,8 @@ class Plugin(WithLogin, WithCaptcha, WithCheckHash, WithStat):
     _TORRENT_HASH_REGEXP = re.compile(r"<a href=\"magnet:\?xt=urn:btih:(?P<torrent_hash>[a-fA-F0-9]{40})&[^\"]+\""
                                       r" class=\"(med )?magnet-link\" data-topic_id=\"\d+\"")
 
+    _BATCH_HASH_URL = "https://api.rutracker.cc/v1/get_tor_hash?by=topic_id&val={torrent_ids}"
+
     _STAT_URL = _TORRENT_HASH_URL
     _STAT_OK_REGEXP = _TORRENT_HASH_REGEXP
     _STAT_SEEDERS_REGEXP = re.compile(r"<span class=\"seed\">Сиды:&nbsp;\s+<b>(?P<seeders>\d+)</b></span>")
@@ -70,15 +74,27 @@ class Plugin(WithLogin, WithCaptcha, WithCheckHash, WithStat):
 
     def fetch_new_data(self, torrent: Torrent) -> bytes:
         torrent_id = self._assert_match(torrent)
-        self._set_cookie("bb_dl", torrent_id, path="/forum/", secure=True)
-        return self._assert_valid_data(self._read_url(
-            url=f"https://rutracker.org/forum/dl.php?t={torrent_id}",
-            data=b"",
-            headers={
-                "Referer": f"https://rutracker.org/forum/viewtopic.php?t={torrent_id}",
-                "Origin":  "https://rutracker.org",
-            }
-        ))
+        with self._cookies_lock:
+            self._set_cookie("bb_dl", torrent_id, path="/forum/", secure=True)
+            return self._assert_valid_data(self._read_url(
+                url=f"https://rutracker.org/forum/dl.php?t={torrent_id}",
+                data=b"",
+                headers={
+                    "Referer": f"https://rutracker.org/forum/viewtopic.php?t={torrent_id}",
+                    "Origin":  "https://rutracker.org",
+                }
+            ))
+
+    def _parse_batch_hashes(self, data: bytes) -> Dict[str, Optional[str]]:
+        try:
+            result = json.loads(data)["result"]
+        except (ValueError, KeyError, TypeError):
+            result = None
+        self._assert_logic(isinstance(result, dict), f"Invalid API response: {data[:20]!r} ...")
+        return {
+            str(torrent_id): (str(torrent_hash) if torrent_hash else None)
+            for (torrent_id, torrent_hash) in result.items()  # type: ignore
+        }
 
     def login(self) -> None:
         self._assert_required_user_passwd()
@@ -17,25 +17,43 @@
 """
 
 
+import sys
 import os
 import re
+import mmap
+import array
+import contextlib
 import hashlib
 import base64
 import urllib.parse
 import itertools
 
 from typing import List
+from typing import Tuple
 from typing import Dict
+from typing import Set
 from typing import FrozenSet
+from typing import Mapping
+from typing import ItemsView
 from typing import NamedTuple
+from typing import Iterable
+from typing import Iterator
+from typing import Generator
+from typing import Callable
+from typing import Sequence
 from typing import Optional
 from typing import Union
 from typing import Any
 
-import chardet
-
 from .thirdparty import bencoder  # type: ignore
 
+from .tools import BytesDecoder
+
+
+# =====
+# The piece hashes are the largest part of any torrent, but only the data checking needs them
+_PIECES_KEYS = frozenset([b"pieces", b"piece layers"])
+
 
 # =====
 class TorrentEntryAttrs(NamedTuple):
@@ -51,6 +69,112 @@ class TorrentEntryAttrs(NamedTuple):
         return TorrentEntryAttrs(is_dir=True, size=0)
 
 
+class FileTree(Mapping[str, TorrentEntryAttrs]):
+    # A compact {path: TorrentEntryAttrs} for the huge file lists. The entries are stored
+    # as a flat tree of the interned path components, the full paths are built on iteration.
+
+    __slots__ = ("__prefix", "__names", "__parents", "__sizes", "__lookup")
+
+    def __init__(self, prefix: str, entries: Iterable[Tuple[Sequence[str], Optional[int]]]) -> None:
+        # Each entry is a list of the path components and the file size, None is for the directories.
+        # The intermediate directories are added automatically.
+        self.__prefix = prefix
+        self.__names: List[str] = []
+        self.__parents = array.array("i")
+        self.__sizes = array.array("q")
+        self.__lookup: Optional[Dict[str, int]] = None
+
+        nodes: Dict[Tuple[int, str], int] = {}
+        for (parts, size) in entries:
+            parent = -1
+            for part in _split_parts(parts):
+                index = nodes.get((parent, part))
+                if index is None:
+                    index = nodes[(parent, part)] = len(self.__names)
+                    self.__names.append(sys.intern(part))
+                    self.__parents.append(parent)
+                    self.__sizes.append(-1)
+                else:
+                    self.__sizes[index] = -1
+                parent = index
+            if size is not None and parent >= 0:
+                self.__sizes[parent] = size
+
+    def __getstate__(self) -> Tuple[str, List[str], array.array, array.array]:
+        return (self.__prefix, self.__names, self.__parents, self.__sizes)
+
+    def __setstate__(self, state: Tuple[str, List[str], array.array, array.array]) -> None:
+        (self.__prefix, names, self.__parents, self.__sizes) = state
+        self.__names = list(map(sys.intern, names))
+        self.__lookup = None
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+    def __iter__(self) -> Iterator[str]:
+        for (path, _) in self.__iter_nodes():
+            yield path
+
+    def __getitem__(self, path: str) -> TorrentEntryAttrs:
+        if self.__lookup is None:
+            self.__lookup = dict(self.__iter_nodes())
+        return self.__make_attrs(self.__lookup[path])
+
+    def items(self) -> ItemsView[str, TorrentEntryAttrs]:
+        return _FileTreeItemsView(self, self.__iter_items)
+
+    def get_nested(self) -> Dict[str, Dict]:
+        # {name: {name: {...}}}, the empty and the current dir components are skipped like os.path.normpath()
+        nested: Dict[str, Dict] = {}
+        top = nested
+        if self.__prefix:
+            for (index, part) in enumerate(os.path.normpath(self.__prefix).split(os.path.sep)):
+                if index == 0 or part:
+                    top = top.setdefault(part, {})
+        dirs: List[Dict[str, Dict]] = []
+        for (name, parent) in zip(self.__names, self.__parents):
+            local = (top if parent < 0 else dirs[parent])
+            if name in ("", "."):
+                dirs.append(local)
+            else:
+                dirs.append(local.setdefault(name, {}))
+        return nested
+
+    def __iter_items(self) -> Generator[Tuple[str, TorrentEntryAttrs], None, None]:
+        for (path, index) in self.__iter_nodes():
+            yield (path, self.__make_attrs(index))
+
+    def __iter_nodes(self) -> Generator[Tuple[str, int], None, None]:
+        # The parents are always stored before their children
+        parents = set(self.__parents)
+        paths: Dict[int, str] = {}
+        for (index, (name, parent)) in enumerate(zip(self.__names, self.__parents)):
+            path = (os.path.join(self.__prefix, name) if parent < 0 else paths[parent] + os.path.sep + name)
+            if index in parents:
+                paths[index] = path
+            yield (path, index)
+
+    def __make_attrs(self, index: int) -> TorrentEntryAttrs:
+        size = self.__sizes[index]
+        return (TorrentEntryAttrs.dir() if size < 0 else TorrentEntryAttrs.file(size))
+
+
+class _FileTreeItemsView(ItemsView[str, TorrentEntryAttrs]):
+    def __init__(self, tree: FileTree, iter_items: Callable[[], Iterator[Tuple[str, TorrentEntryAttrs]]]) -> None:
+        super().__init__(tree)
+        self.__iter_items = iter_items
+
+    def __iter__(self) -> Iterator[Tuple[str, TorrentEntryAttrs]]:
+        return self.__iter_items()
+
+
+def _split_parts(parts: Sequence[str]) -> Iterable[str]:
+    # The separator inside of the component means the same path as the separate components
+    if any(os.path.sep in part for part in parts):
+        return os.path.sep.join(parts).split(os.path.sep)
+    return parts
+
+
 class TorrentsDiff(NamedTuple):
     added: FrozenSet[str] = frozenset()
     removed: FrozenSet[str] = frozenset()
@@ -61,32 +185,122 @@ class TorrentsDiff(NamedTuple):
         return bool(self.added or self.removed or self.modified or self.type_modified)
 
 
-class Torrent:
-    def __init__(self, data: Optional[bytes]=None, path: Optional[str]=None) -> None:
+class TorrentSummary(NamedTuple):
+    # The most used fields, enough to match and check the torrent without loading the file
+    hash: str
+    name: str
+    comment: str
+    size: int
+    private: bool
+
+
+class Torrent:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    def __init__(  # pylint: disable=too-many-positional-arguments
+        self,
+        data: Optional[bytes]=None,
+        path: Optional[str]=None,
+        skip_pieces: bool=False,
+        use_mmap: bool=False,
+        summary: Optional[TorrentSummary]=None,
+    ) -> None:
+
         # https://wiki.theory.org/index.php/BitTorrentSpecification
+        # With the summary the file is loaded on the first access to any other field.
 
         self.__path = path
         self.__data: Optional[bytes] = None
         self.__bencode: Optional[Dict] = None
+        self.__info_span: Optional[Tuple[int, int]] = None
+        self.__info_digest = b""
         self.__hash: str = ""
         self.__scrape_hash: str = ""
+        self.__decoder: Optional[BytesDecoder] = None
+        self.__decoded_name: Optional[str] = None
+        self.__decoded_comment: Optional[str] = None
+        self.__summary: Optional[TorrentSummary] = None
+        self.__lazy: Optional[Tuple[bool, bool]] = None  # (skip_pieces, use_mmap) for the deferred load
 
         if data is not None:
-            self.load_from_data(data, path)
+            self.load_from_data(data, path, skip_pieces)
         elif path is not None:
-            self.load_from_file(path)
-
-    def load_from_file(self, path: str) -> "Torrent":
+            if summary is not None:
+                self.__set_summary(summary)
+                self.__lazy = (skip_pieces, use_mmap)
+            else:
+                self.load_from_file(path, skip_pieces, use_mmap)
+
+    def load_from_file(self, path: str, skip_pieces: bool=False, use_mmap: bool=False) -> "Torrent":
+        if use_mmap:
+            # The data is not kept in memory and will be read again by get_data() on demand
+            with _map_file(path) as data:
+                self.__load(data, path, skip_pieces)
+            self.__data = None
+            return self
         with open(path, "rb") as torrent_file:
-            return self.load_from_data(torrent_file.read(), path)
+            return self.load_from_data(torrent_file.read(), path, skip_pieces)
 
-    def load_from_data(self, data: bytes, path: Optional[str]=None) -> "Torrent":
-        self.__bencode = decode_torrent_data(data)
-        self.__path = path
+    def load_from_data(self, data: bytes, path: Optional[str]=None, skip_pieces: bool=False) -> "Torrent":
+        self.__load(data, path, skip_pieces)
         self.__data = data
+        return self
+
+    @classmethod
+    def load_many_from_files(
+        cls,
+        paths: List[str],
+        skip_pieces: bool=False,
+        precalculate_hashes: bool=False,
+    ) -> List[Optional["Torrent"]]:
+
+        # The batch is decoded by one scan without the GIL, the SHA-1 of the info dicts
+        # is calculated by hashlib which releases it too. So the threads can load their batches
+        # in parallel. The broken torrents are None, the data is not kept.
+        datas: List[bytes] = []
+        for path in paths:
+            with open(path, "rb") as torrent_file:
+                datas.append(torrent_file.read())
+
+        torrents: List[Optional[Torrent]] = []
+        for (path, data, decoded) in zip(paths, datas, _decode_many_torrent_data_spans(datas, _get_skip_keys(skip_pieces))):
+            if decoded is None:
+                torrents.append(None)
+            else:
+                torrent = cls()
+                torrent.__set_decoded(decoded, path)
+                if precalculate_hashes:
+                    torrent.__set_info_digest(data)
+                torrents.append(torrent)
+        return torrents
+
+    def __load(self, data: Union[bytes, mmap.mmap], path: Optional[str], skip_pieces: bool) -> None:
+        self.__set_decoded(_decode_torrent_data_spans(data, _get_skip_keys(skip_pieces)), path)
+
+    def __set_decoded(self, decoded: Tuple[Dict, Dict[bytes, Tuple[int, int]]], path: Optional[str]) -> None:
+        (self.__bencode, spans) = decoded
+        self.__info_span = spans.get(b"info")
+        self.__path = path
+        self.__info_digest = b""
         self.__hash = ""
         self.__scrape_hash = ""
-        return self
+        self.__decoder = None
+        self.__decoded_name = None
+        self.__decoded_comment = None
+        self.__summary = None
+        self.__lazy = None
+
+    def __set_summary(self, summary: TorrentSummary) -> None:
+        self.__summary = summary
+        self.__hash = summary.hash
+        self.__decoded_name = summary.name
+        self.__decoded_comment = summary.comment
+
+    def __get_bencode(self) -> Dict:
+        if self.__bencode is None and self.__lazy is not None:
+            summary = self.__summary
+            self.load_from_file(self.get_path(), *self.__lazy)
+            self.__hash = summary.hash  # type: ignore  # The file was not changed since the summary
+        assert self.__bencode, (self, self.__bencode)
+        return self.__bencode
 
     # =====
 
@@ -95,50 +309,78 @@ class Torrent:
         return self.__path
 
     def get_data(self) -> bytes:
+        if self.__data is None:
+            with open(self.get_path(), "rb") as torrent_file:
+                return torrent_file.read()
         assert self.__data, self
         return self.__data
 
+    def get_summary(self) -> TorrentSummary:
+        if self.__summary is None:
+            self.__summary = TorrentSummary(
+                hash=self.get_hash(),
+                name=self.get_name(),
+                comment=self.get_comment(),
+                size=self.get_size(),
+                private=self.is_private(),
+            )
+        return self.__summary
+
     # =====
 
     def get_name(self, surrogate_escape: bool=False) -> str:
-        assert self.__bencode, (self, self.__bencode)
-        return self.__decode(self.__bencode[b"info"][b"name"], surrogate_escape)
+        if surrogate_escape:
+            return self.__decode(self.__get_bencode()[b"info"][b"name"], True)
+        if self.__decoded_name is None:
+            self.__decoded_name = self.__decode(self.__get_bencode()[b"info"][b"name"])
+        return self.__decoded_name
 
     def get_comment(self) -> str:
-        assert self.__bencode, (self, self.__bencode)
-        return self.__decode(self.__bencode.get(b"comment", "").strip())
+        if self.__decoded_comment is None:
+            # Called by each tracker on matching
+            self.__decoded_comment = self.__decode(self.__get_bencode().get(b"comment", "").strip())
+        return self.__decoded_comment
 
     def get_creation_date(self) -> int:
-        assert self.__bencode, (self, self.__bencode)
-        return self.__bencode.get(b"creation date", 0)
+        bencode = self.__get_bencode()
+        return bencode.get(b"creation date", 0)
 
     def get_created_by(self) -> Optional[str]:
-        assert self.__bencode, (self, self.__bencode)
-        created_by = self.__bencode.get(b"created by")
+        bencode = self.__get_bencode()
+        created_by = bencode.get(b"created by")
         return (self.__decode(created_by) if created_by is not None else None)
 
     def get_announce(self) -> Optional[str]:
-        assert self.__bencode, (self, self.__bencode)
-        announce = self.__bencode.get(b"announce")
+        bencode = self.__get_bencode()
+        announce = bencode.get(b"announce")
         return (self.__decode(announce) if announce is not None else None)
 
     def get_announce_list(self) -> List[List[str]]:
-        assert self.__bencode, (self, self.__bencode)
+        bencode = self.__get_bencode()
         return [
             list(map(self.__decode, announce_list))
-            for announce_list in self.__bencode.get(b"announce-list", [])
+            for announce_list in bencode.get(b"announce-list", [])
         ]
 
     def is_private(self) -> bool:
-        assert self.__bencode, (self, self.__bencode)
-        return bool(self.__bencode[b"info"].get(b"private", 0))
+        if self.__bencode is None and self.__summary is not None:
+            return self.__summary.private
+        return bool(self.__get_bencode()[b"info"].get(b"private", 0))
+
+    def get_piece_length(self) -> int:
+        bencode = self.__get_bencode()
+        return bencode[b"info"][b"piece length"]
+
+    def get_pieces(self) -> bytes:
+        # Concatenated SHA-1 of the pieces, empty if the torrent was loaded with skip_pieces
+        bencode = self.__get_bencode()
+        return bencode[b"info"].get(b"pieces", b"")
 
     # =====
 
     def get_hash(self) -> str:
         if not self.__hash:
-            assert self.__bencode, (self, self.__bencode)
-            self.__hash = hashlib.sha1(bencoder.bencode(self.__bencode[b"info"])).hexdigest().lower()
+            self.__hash = self.__get_info_digest().hex()
         return self.__hash
 
     def get_scrape_hash(self) -> str:
@@ -151,11 +393,8 @@ class Torrent:
     def make_magnet(self, extras: Optional[List[str]]=None) -> str:
         extras = (extras or [])
 
-        assert self.__bencode, (self, self.__bencode)
         # http://stackoverflow.com/questions/12479570/given-a-torrent-file-how-do-i-generate-a-magnet-link-in-python
-        info_sha1 = hashlib.sha1(bencoder.bencode(self.__bencode[b"info"]))
-        info_digest = info_sha1.digest()
-        b32_hash = base64.b32encode(info_digest).decode()
+        b32_hash = base64.b32encode(self.__get_info_digest()).decode()
 
         magnet = "magnet:?xt=" + urllib.parse.quote_plus("urn:btih:" + b32_hash)
         if "name" in extras:
@@ -174,57 +413,81 @@ class Torrent:
     # =====
 
     def get_size(self) -> int:
-        assert self.__bencode, (self, self.__bencode)
+        if self.__bencode is None and self.__summary is not None:
+            return self.__summary.size
+        bencode = self.__get_bencode()
         if self.is_single_file():
-            return self.__bencode[b"info"][b"length"]
+            return bencode[b"info"][b"length"]
         else:
             size = 0
-            for fstruct in self.__bencode[b"info"][b"files"]:
+            for fstruct in bencode[b"info"][b"files"]:
                 size += fstruct[b"length"]
             return size
 
     def is_single_file(self) -> bool:
-        assert self.__bencode, (self, self.__bencode)
-        return (b"files" not in self.__bencode[b"info"])
+        bencode = self.__get_bencode()
+        return (b"files" not in bencode[b"info"])
 
-    def get_files(self, prefix: str="") -> Dict[str, TorrentEntryAttrs]:
-        assert self.__bencode, (self, self.__bencode)
-        base = os.path.join(prefix, self.get_name())
+    def get_files(self, prefix: str="") -> FileTree:
+        bencode = self.__get_bencode()
+        name = self.get_name()
         if self.is_single_file():
-            return {base: TorrentEntryAttrs.file(self.__bencode[b"info"][b"length"])}
+            return FileTree(prefix, [([name], bencode[b"info"][b"length"])])
         else:
-            files = {base: TorrentEntryAttrs.dir()}
-            for fstruct in self.__bencode[b"info"][b"files"]:
-                name = None
-                for index in range(len(fstruct[b"path"])):
-                    name = os.path.join(base, os.path.sep.join(map(self.__decode, fstruct[b"path"][0:index + 1])))
-                    files[name] = TorrentEntryAttrs.dir()
-                assert name is not None
-                files[name] = TorrentEntryAttrs.file(fstruct[b"length"])
-            return files
+            return FileTree(prefix, itertools.chain([([name], None)], (
+                ([name] + list(map(self.__decode, fstruct[b"path"])), fstruct[b"length"])
+                for fstruct in bencode[b"info"][b"files"]
+            )))
+
+    def get_pad_files(self, prefix: str="") -> FrozenSet[str]:
+        # The BEP 47 padding files from get_files(). They are zeros in the data stream and are not stored.
+        bencode = self.__get_bencode()
+        if self.is_single_file():
+            return frozenset()
+        top = os.path.join(prefix, self.get_name())
+        pads: Set[str] = set()
+        for fstruct in bencode[b"info"][b"files"]:
+            path = os.path.sep.join([top, *_split_parts(list(map(self.__decode, fstruct[b"path"])))])
+            if b"p" in fstruct.get(b"attr", b"") or is_pad_file_path(path):
+                pads.add(path)
+        return frozenset(pads)
 
     # =====
 
+    def __set_info_digest(self, data: Union[bytes, mmap.mmap]) -> None:
+        assert self.__info_span, (self, "Missing info dict")
+        # The info dict is hashed as is, directly from the source data
+        self.__info_digest = _get_span_digest(data, self.__info_span)
+
+    def __get_info_digest(self) -> bytes:
+        if not self.__info_digest:
+            self.__get_bencode()
+            if self.__data is not None:
+                self.__set_info_digest(self.__data)
+            else:
+                with _map_file(self.get_path()) as data:
+                    self.__set_info_digest(data)
+        return self.__info_digest
+
     def __decode(self, value: Any, surrogate_escape: bool=False) -> str:  # pylint: disable=inconsistent-return-statements
-        assert self.__bencode, (self, self.__bencode)
+        bencode = self.__get_bencode()
         if isinstance(value, bytes):
             if surrogate_escape:
                 # https://www.python.org/dev/peps/pep-0383
                 return value.decode("ascii", "surrogateescape")
 
-            for encoding in [self.__bencode.get(b"encoding", b"utf-8").decode(), "cp1251"]:
-                try:
-                    return value.decode(encoding)
-                except UnicodeDecodeError:
-                    pass
-
-            encoding = chardet.detect(value)["encoding"]
-            assert encoding is not None, f"Can't determine encoding for bytes string: {value!r}"
-            return value.decode(encoding)
+            if self.__decoder is None:
+                self.__decoder = BytesDecoder([bencode.get(b"encoding", b"utf-8").decode(), "cp1251"])
+            return self.__decoder.decode(value)
         else:
             return value
 
 
+def is_pad_file_path(path: str) -> bool:
+    # The padding files are placed to .pad/N by the convention, the clients without the attrs show them so
+    return (os.path.basename(os.path.dirname(path)) == ".pad")
+
+
 def is_valid_torrent_data(data: bytes) -> bool:
     try:
         decode_torrent_data(data)
@@ -243,17 +506,51 @@ def decode_torrent_data(data: bytes) -> Dict:
     return result
 
 
+def _decode_torrent_data_spans(data: Union[bytes, mmap.mmap], skip: FrozenSet[bytes]) -> Tuple[Dict, Dict[bytes, Tuple[int, int]]]:
+    try:
+        return bencoder.bdecode_spans(data, skip)
+    except bencoder.BTFailure as err:
+        raise ValueError from err
+
+
+def _decode_many_torrent_data_spans(
+    datas: List[bytes],
+    skip: FrozenSet[bytes],
+) -> List[Optional[Tuple[Dict, Dict[bytes, Tuple[int, int]]]]]:
+
+    return [
+        (None if isinstance(result, bencoder.BTFailure) else result)
+        for result in bencoder.bdecode_spans_many(datas, skip)
+    ]
+
+
+def _get_skip_keys(skip_pieces: bool) -> FrozenSet[bytes]:
+    return (_PIECES_KEYS if skip_pieces else frozenset())
+
+
+@contextlib.contextmanager
+def _map_file(path: str) -> Generator[mmap.mmap, None, None]:
+    with open(path, "rb") as torrent_file:
+        with mmap.mmap(torrent_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def _get_span_digest(data: Union[bytes, mmap.mmap], span: Tuple[int, int]) -> bytes:
+    with memoryview(data) as view:
+        return hashlib.sha1(view[span[0]:span[1]]).digest()
+
+
 def is_torrent_hash(text: str) -> bool:
     return (re.match(r"[\da-fA-F]{40}", text) is not None)
 
 
 def get_torrents_difference(
-    old: Union[Torrent, Dict[str, TorrentEntryAttrs]],
-    new: Union[Torrent, Dict[str, TorrentEntryAttrs]],
+    old: Union[Torrent, Mapping[str, TorrentEntryAttrs]],
+    new: Union[Torrent, Mapping[str, TorrentEntryAttrs]],
 ) -> TorrentsDiff:
 
-    old_files = (old.get_files() if isinstance(old, Torrent) else old)
-    files = (new.get_files() if isinstance(new, Torrent) else new)
+    old_files = dict((old.get_files() if isinstance(old, Torrent) else old).items())
+    files = dict((new.get_files() if isinstance(new, Torrent) else new).items())
 
     modified = set()
     type_modified = set()
@@ -38,72 +38,357 @@ class BTFailure(Exception):
     pass
 
 
-def decode_int(bytes x, int f):
-    f += 1
-    cdef long new_f = x.index(b'e', f)
-    n = int(x[f:new_f])
-    if x[f] == b'-'[0]:
-        if x[f + 1] == b'0'[0]:
-            raise ValueError()
-    elif x[f] == b'0'[0] and new_f != f + 1:
-        raise ValueError()
-    return n, new_f + 1
-
-
-def decode_string(bytes x, int f):
-    cdef long colon = x.index(b':', f)
-    cdef long n = int(x[f:colon])
-    if x[f] == b'0'[0] and colon != f + 1:
-        raise ValueError()
-    colon += 1
-    return x[colon:colon + n], colon + n
-
+# The decoder works over any object supporting the buffer protocol (bytes, mmap, memoryview),
+# so the data is never copied as a whole. Only the decoded strings are allocated.
 
-def decode_list(bytes x, int f):
-    r, f = [], f + 1
-    while x[f] != END_CHAR:
-        v, f = decode_func[x[f]](x, f)
-        r.append(v)
-    return r, f + 1
+from cpython.bytes cimport PyBytes_FromStringAndSize
 
+cdef int MAX_DEPTH = 1000
 
-def decode_dict(bytes x, int f):
-    r = OrderedDict()
-    f += 1
-    while x[f] != END_CHAR:
-        k, f = decode_string(x, f)
-        r[k], f = decode_func[x[f]](x, f)
-    return r, f + 1
-
-
-decode_func = dict()
 
-for func, keys in [
-    (decode_list, 'l'),
-    (decode_dict, 'd'),
-    (decode_int, 'i'),
-    (decode_string, [str(x) for x in range(10)])
-]:
-    for key in keys:
-        if IS_PY2:
-            decode_func[key] = func
-        else:
-            decode_func[ord(key)] = func
+cdef long scan_value(const unsigned char[:] x, long f, int depth) except -1:
+    # Returns the end offset of the value without building any objects
+    cdef unsigned char c = x[f]
+    if depth > MAX_DEPTH:
+        raise ValueError()
+    if c == ord('i'):
+        f += 1
+        while x[f] != ord('e'):
+            f += 1
+        return f + 1
+    elif c == ord('l') or c == ord('d'):
+        f += 1
+        while x[f] != ord('e'):
+            f = scan_value(x, f, depth + 1)
+        return f + 1
+    elif ord('0') <= c <= ord('9'):
+        return scan_string(x, f)
+    raise ValueError()
+
+
+cdef long scan_string(const unsigned char[:] x, long f) except -1:
+    cdef long n = 0
+    cdef long colon = f
+    cdef unsigned char c
+    while True:
+        c = x[colon]
+        if c == ord(':'):
+            break
+        if not (ord('0') <= c <= ord('9')):
+            raise ValueError()
+        n = n * 10 + (c - ord('0'))
+        if n > x.shape[0]:
+            raise ValueError()
+        colon += 1
+    if colon == f or (x[f] == ord('0') and colon != f + 1):
+        raise ValueError()
+    if colon + 1 + n > x.shape[0]:
+        raise ValueError()
+    return colon + 1 + n
+
+
+cdef bytes decode_string(const unsigned char[:] x, long *f):
+    cdef long end = scan_string(x, f[0])
+    cdef long colon = f[0]
+    while x[colon] != ord(':'):
+        colon += 1
+    f[0] = end
+    if end == colon + 1:
+        return b''
+    return PyBytes_FromStringAndSize(<const char *>&x[colon + 1], end - colon - 1)
+
+
+cdef object decode_int(const unsigned char[:] x, long *f):
+    cdef long start = f[0] + 1
+    cdef long end = start
+    while x[end] != ord('e'):
+        end += 1
+    if x[start] == ord('-'):
+        if x[start + 1] == ord('0'):
+            raise ValueError()
+    elif x[start] == ord('0') and end != start + 1:
+        raise ValueError()
+    n = int(PyBytes_FromStringAndSize(<const char *>&x[start], end - start))
+    f[0] = end + 1
+    return n
 
 
-def bdecode2(bytes x):
+cdef object decode_value(const unsigned char[:] x, long *f, frozenset skip, int depth):
+    # The dict values for the keys from the skip set are only scanned
+    # and omitted from the result
+    cdef unsigned char c = x[f[0]]
+    if depth > MAX_DEPTH:
+        raise ValueError()
+    if c == ord('i'):
+        return decode_int(x, f)
+    elif c == ord('l'):
+        r = []
+        f[0] += 1
+        while x[f[0]] != ord('e'):
+            r.append(decode_value(x, f, skip, depth + 1))
+        f[0] += 1
+        return r
+    elif c == ord('d'):
+        r = OrderedDict()
+        f[0] += 1
+        while x[f[0]] != ord('e'):
+            k = decode_string(x, f)
+            if skip and k in skip:
+                f[0] = scan_value(x, f[0], depth + 1)
+            else:
+                r[k] = decode_value(x, f, skip, depth + 1)
+        f[0] += 1
+        return r
+    elif ord('0') <= c <= ord('9'):
+        return decode_string(x, f)
+    raise ValueError()
+
+
+def bdecode2(x):
+    cdef const unsigned char[:] view = x
+    cdef long f = 0
     try:
-        r, l = decode_func[x[0]](x, 0)
-    except (IndexError, KeyError, ValueError):
+        r = decode_value(view, &f, None, 0)
+    except (IndexError, ValueError):
         raise BTFailure("not a valid bencoded string")
-    return r, l
+    return r, f
+
 
-def bdecode(bytes x):
+def bdecode(x):
     r, l = bdecode2(x)
     if l != len(x):
         raise BTFailure("invalid bencoded value (data after valid prefix)")
     return r
 
+
+# The spans decoder scans the data once without the GIL and remembers the found values as tokens.
+# Then the objects are built right from the tokens, so the bytes are not scanned for the second time.
+# The threads can decode their buffers in parallel, only the building of the objects is serialized.
+
+from libc.stdlib cimport calloc, realloc, free
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
+
+
+cdef struct Token:
+    unsigned char kind  # i, l, d or 0 for the string
+    Py_ssize_t pos  # The offset of the value
+    Py_ssize_t end  # The offset after the value
+    Py_ssize_t data  # The offset of the string payload or the integer digits
+    Py_ssize_t next  # The index of the token after the value and all of the nested ones
+
+
+cdef struct Tokens:
+    Token *items
+    Py_ssize_t count
+    Py_ssize_t size
+    bint no_memory
+
+
+cdef inline bint is_digit(unsigned char c) noexcept nogil:
+    return (ord('0') <= c <= ord('9'))
+
+
+cdef Py_ssize_t push_token(Tokens *tokens, unsigned char kind, Py_ssize_t pos) noexcept nogil:
+    cdef Token *items
+    cdef Py_ssize_t size
+    if tokens.count == tokens.size:
+        size = (tokens.size * 2 if tokens.size else 64)
+        items = <Token *>realloc(tokens.items, size * sizeof(Token))
+        if items == NULL:
+            tokens.no_memory = True
+            return -1
+        tokens.items = items
+        tokens.size = size
+    tokens.items[tokens.count].kind = kind
+    tokens.items[tokens.count].pos = pos
+    tokens.count += 1
+    return tokens.count - 1
+
+
+cdef Py_ssize_t scan_token(const unsigned char *x, Py_ssize_t size, Py_ssize_t f, Tokens *tokens, int depth) noexcept nogil:
+    # Returns the end offset of the value or -1 for the invalid data
+    cdef Py_ssize_t index
+    cdef Py_ssize_t start
+    cdef Py_ssize_t n
+    cdef unsigned char c
+    if f >= size or depth > MAX_DEPTH:
+        return -1
+    c = x[f]
+    if c == ord('i'):
+        index = push_token(tokens, c, f)
+        if index < 0:
+            return -1
+        f += 1
+        start = f
+        if f < size and x[f] == ord('-'):
+            f += 1
+        if f >= size or not is_digit(x[f]):
+            return -1
+        if x[f] == ord('0') and (f != start or f + 1 >= size or x[f + 1] != ord('e')):
+            return -1  # Leading zeros and -0
+        while f < size and is_digit(x[f]):
+            f += 1
+        if f >= size or x[f] != ord('e'):
+            return -1
+        tokens.items[index].data = start
+        f += 1
+    elif c == ord('l') or c == ord('d'):
+        index = push_token(tokens, c, f)
+        if index < 0:
+            return -1
+        f += 1
+        while True:
+            if f >= size:
+                return -1
+            if x[f] == ord('e'):
+                break
+            if c == ord('d'):
+                if not is_digit(x[f]):
+                    return -1  # The keys are strings only
+                f = scan_token(x, size, f, tokens, depth + 1)
+                if f < 0 or f >= size or x[f] == ord('e'):
+                    return -1  # The key without a value
+            f = scan_token(x, size, f, tokens, depth + 1)
+            if f < 0:
+                return -1
+        f += 1
+    elif is_digit(c):
+        index = push_token(tokens, 0, f)
+        if index < 0:
+            return -1
+        n = 0
+        start = f
+        while True:
+            if f >= size:
+                return -1
+            c = x[f]
+            if c == ord(':'):
+                break
+            if not is_digit(c):
+                return -1
+            n = n * 10 + (c - ord('0'))
+            if n > size:
+                return -1
+            f += 1
+        if x[start] == ord('0') and f != start + 1:
+            return -1
+        f += 1
+        if n > size - f:
+            return -1
+        tokens.items[index].data = f
+        f += n
+    else:
+        return -1
+    tokens.items[index].end = f
+    tokens.items[index].next = tokens.count
+    return f
+
+
+cdef Py_ssize_t scan_dict(const unsigned char *x, Py_ssize_t size, Tokens *tokens) noexcept nogil:
+    tokens.count = 0
+    if size == 0 or x[0] != ord('d'):
+        return -1
+    return scan_token(x, size, 0, tokens, 0)
+
+
+cdef object build_value(const unsigned char *x, const Token *items, Py_ssize_t index, frozenset skip):
+    cdef const Token *token = &items[index]
+    cdef Py_ssize_t child
+    if token.kind == ord('i'):
+        return int(PyBytes_FromStringAndSize(<const char *>&x[token.data], token.end - 1 - token.data))
+    elif token.kind == ord('l'):
+        r = []
+        child = index + 1
+        while child < token.next:
+            r.append(build_value(x, items, child, skip))
+            child = items[child].next
+        return r
+    elif token.kind == ord('d'):
+        r = OrderedDict()
+        child = index + 1
+        while child < token.next:
+            k = build_value(x, items, child, skip)
+            child = items[child].next
+            if not (skip and k in skip):
+                r[k] = build_value(x, items, child, skip)
+            child = items[child].next
+        return r
+    return PyBytes_FromStringAndSize(<const char *>&x[token.data], token.end - token.data)
+
+
+cdef tuple build_spans(const unsigned char *x, Py_ssize_t size, Tokens *tokens, Py_ssize_t end, frozenset skip):
+    cdef const Token *items = tokens.items
+    cdef Py_ssize_t child
+    if tokens.no_memory:
+        raise MemoryError()
+    if end < 0:
+        raise BTFailure("not a valid bencoded dict")
+    if end != size:
+        raise BTFailure("invalid bencoded value (data after valid prefix)")
+    r = OrderedDict()
+    spans = {}
+    child = 1
+    while child < items[0].next:
+        k = build_value(x, items, child, skip)
+        child = items[child].next
+        if k not in skip:
+            r[k] = build_value(x, items, child, skip)
+        spans[k] = (items[child].pos, items[child].end)
+        child = items[child].next
+    return r, spans
+
+
+def bdecode_spans_many(list buffers, frozenset skip=frozenset()):
+    # Decodes a batch of the toplevel dicts like bdecode_spans(). All of the buffers are scanned
+    # in one pass without the GIL. The broken buffers get the BTFailure instances in the result
+    # instead of failing the whole batch.
+    cdef Py_ssize_t count = len(buffers)
+    cdef Py_ssize_t index
+    cdef Py_ssize_t acquired = 0
+    cdef Py_buffer *views = <Py_buffer *>calloc(count or 1, sizeof(Py_buffer))
+    cdef Tokens *tokens = <Tokens *>calloc(count or 1, sizeof(Tokens))
+    cdef Py_ssize_t *ends = <Py_ssize_t *>calloc(count or 1, sizeof(Py_ssize_t))
+    try:
+        if views == NULL or tokens == NULL or ends == NULL:
+            raise MemoryError()
+        for index in range(count):
+            PyObject_GetBuffer(buffers[index], &views[index], PyBUF_SIMPLE)
+            acquired += 1
+        with nogil:
+            for index in range(count):
+                ends[index] = scan_dict(<const unsigned char *>views[index].buf, views[index].len, &tokens[index])
+        results = []
+        for index in range(count):
+            try:
+                results.append(build_spans(
+                    <const unsigned char *>views[index].buf, views[index].len,
+                    &tokens[index], ends[index], skip,
+                ))
+            except BTFailure as err:
+                results.append(err)
+        return results
+    finally:
+        for index in range(acquired):
+            PyBuffer_Release(&views[index])
+        if tokens != NULL:
+            for index in range(count):
+                free(tokens[index].items)
+        free(views)
+        free(tokens)
+        free(ends)
+
+
+def bdecode_spans(x, frozenset skip=frozenset()):
+    # Decodes the toplevel dict and returns it together with the byte offsets
+    # of the values: {key: (start, end)}. The span is the exact source of
+    # the value, so x[start:end] can be hashed without re-encoding.
+    # The keys from the skip set are dropped on any level, but their values
+    # are still covered by the spans of the toplevel.
+    result = bdecode_spans_many([x], skip)[0]
+    if isinstance(result, BTFailure):
+        raise result
+    return result
+
 cdef encode(v, list r):
     tp = type(v)
     if tp in encode_func:
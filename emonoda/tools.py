@@ -47,15 +47,30 @@ def sorted_paths(paths: Iterable, get: Optional[Any]=None) -> List:
     return sorted(paths, key=get_path_nulled)
 
 
-def get_decoded_path(path: str) -> str:
+class BytesDecoder:
+    # The strings from the same source (torrent, directory) usually have the same encoding,
+    # so the one detected by chardet is remembered and tried before the next detection.
+
+    def __init__(self, encodings: List[str]) -> None:
+        self.__encodings = list(encodings)
+
+    def decode(self, value: bytes) -> str:
+        for encoding in self.__encodings:
+            try:
+                return value.decode(encoding)
+            except UnicodeDecodeError:
+                pass
+
+        encoding = chardet.detect(value)["encoding"]
+        assert encoding is not None, f"Can't determine encoding for bytes string: {value!r}"
+        decoded = value.decode(encoding)
+        self.__encodings.append(encoding)
+        return decoded
+
+
+def get_decoded_path(path: str, decoder: Optional[BytesDecoder]=None) -> str:
     try:
         path.encode()
         return path
     except UnicodeEncodeError:
-        path_bytes = os.fsencode(path)
-        try:
-            return path_bytes.decode("cp1251")
-        except UnicodeDecodeError:
-            encoding = chardet.detect(path_bytes)["encoding"]
-            assert encoding is not None, f"Can't determine encoding for bytes string: {path_bytes!r}"
-            return path_bytes.decode(encoding)
+        return (decoder or BytesDecoder(["cp1251"])).decode(os.fsencode(path))
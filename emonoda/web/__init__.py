@@ -23,6 +23,9 @@ import urllib.parse
 import urllib.error
 import http.client
 import http.cookiejar
+import email.utils
+import threading
+import random
 import io
 import time
 
@@ -30,10 +33,12 @@ from typing import Tuple
 from typing import List
 from typing import Dict
 from typing import NamedTuple
+from typing import Union
 from typing import Optional
 
 from . import gziphandler
 from . import sockshandler
+from . import aioopener
 
 
 # =====
@@ -65,8 +70,57 @@ def build_opener(
     return urllib.request.build_opener(*handlers)
 
 
-def read_url(  # pylint: disable=too-many-positional-arguments
-    opener: urllib.request.OpenerDirector,
+class RateLimiter:
+    # Token bucket: the burst of requests at once, and then the rate per second.
+    # The rate is halved when the site asks to slow down and is restored step by step
+    # by the successful requests, so it's going around the real limit of the site.
+
+    def __init__(self, rate: float, burst: int=1) -> None:
+        self.__max_rate = rate
+        self.__rate = rate
+        self.__burst = max(burst, 1)
+
+        self.__lock = threading.Lock()
+        self.__tokens = float(self.__burst)
+        self.__updated = time.monotonic()  # May be in the future after slow_down()
+
+    def is_enabled(self) -> bool:
+        # The zero rate disables the limiter, acquire() and slow_down() are doing nothing
+        return (self.__max_rate > 0)
+
+    def acquire(self) -> None:
+        if self.__max_rate <= 0:
+            return
+        with self.__lock:
+            now = self.__refill()
+            self.__tokens -= 1  # Reserve the token, the waiting is going without the lock
+            wait = (self.__updated - now) + max(-self.__tokens, 0) / self.__rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def slow_down(self, pause: float) -> None:
+        if self.__max_rate > 0:
+            with self.__lock:
+                now = self.__refill()
+                self.__rate = max(self.__rate / 2, self.__max_rate / 16)
+                self.__updated = max(self.__updated, now + pause)
+                self.__tokens = min(self.__tokens, 1)  # No bursts after the pause
+
+    def speed_up(self) -> None:
+        if self.__max_rate > 0 and self.__rate < self.__max_rate:
+            with self.__lock:
+                self.__rate = min(self.__rate + self.__max_rate / 16, self.__max_rate)
+
+    def __refill(self) -> float:
+        now = time.monotonic()
+        if now > self.__updated:
+            self.__tokens = min(self.__tokens + (now - self.__updated) * self.__rate, self.__burst)
+            self.__updated = now
+        return now
+
+
+def read_url(  # pylint: disable=too-many-positional-arguments,too-many-arguments,too-many-branches,too-many-locals
+    opener: Union[urllib.request.OpenerDirector, aioopener.AsyncOpener],
     url: str,
     data: Optional[bytes]=None,
     headers: Optional[Dict[str, str]]=None,
@@ -75,21 +129,40 @@ def read_url(  # pylint: disable=too-many-positional-arguments
     retries_sleep: float=1.0,
     retry_codes: Optional[List[int]]=None,
     retry_timeout: bool=True,
+    retries_max_sleep: float=0.0,
+    limiter: Optional[RateLimiter]=None,
 ) -> bytes:
 
+    # With retries_max_sleep the sleep is doubled after each failed attempt up to this limit,
+    # with the random jitter, so the concurrent requests don't come back at the same moment.
+    # Retry-After of 429 and 503 is respected, but if it's longer than the limit, there is no retry.
+
     if retry_codes is None:
         retry_codes = [500, 502, 503]
 
+    attempt = 0
     while True:
+        retry_after: Optional[float] = None
+        if limiter is not None:
+            limiter.acquire()
         try:
             request = urllib.request.Request(url, data, (headers or {}))
-            return opener.open(request, timeout=timeout).read()
+            result = opener.open(request, timeout=timeout).read()
+            if limiter is not None:
+                limiter.speed_up()
+            return result
         except socket.timeout:
             if retries == 0 or not retry_timeout:
                 raise
         except urllib.error.HTTPError as err:
+            if err.code in [429, 503]:
+                retry_after = _get_retry_after(err)
+                if limiter is not None:
+                    limiter.slow_down(retry_after or 0.0)
             if retries == 0 or err.code not in retry_codes:
                 raise
+            if retry_after is not None and retry_after > max(retries_max_sleep, retries_sleep):
+                raise
         except urllib.error.URLError as err:
             if "timed out" in str(err.reason):
                 if retries == 0 or not retry_timeout:
@@ -100,8 +173,28 @@ def read_url(  # pylint: disable=too-many-positional-arguments
             if retries == 0:
                 raise
 
-        time.sleep(retries_sleep)
+        if retry_after is not None:
+            if limiter is None or not limiter.is_enabled():  # Otherwise the next acquire() will wait for it
+                time.sleep(retry_after)
+        elif retries_max_sleep > retries_sleep:
+            delay = min(retries_sleep * 2 ** min(attempt, 32), retries_max_sleep)
+            time.sleep(random.uniform(delay / 2, delay))
+        else:
+            time.sleep(retries_sleep)
         retries -= 1
+        attempt += 1
+
+
+def _get_retry_after(err: urllib.error.HTTPError) -> Optional[float]:
+    value = (err.headers.get("Retry-After", "") if err.headers else "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
 
 
 def encode_multipart(
@@ -0,0 +1,373 @@
+"""
+    Emonoda -- A set of tools to organize and manage your torrents
+    Copyright (C) 2015  Devaev Maxim <mdevaev@gmail.com>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import asyncio
+import socket
+import ssl
+import threading
+import urllib.request
+import urllib.parse
+import urllib.error
+import http.client
+import http.cookiejar
+import base64
+import gzip
+import zlib
+import io
+
+from typing import Tuple
+from typing import List
+from typing import Dict
+from typing import NamedTuple
+from typing import Awaitable
+from typing import TypeVar
+from typing import Optional
+
+from ..thirdparty import socks
+
+from . import sockshandler
+
+
+# =====
+_MAX_REDIRECTS = 10  # As in urllib.request.HTTPRedirectHandler
+_MAX_IDLE = 8  # Keep-alive connections per host
+_LINE_LIMIT = 2 ** 20
+_READ_SIZE = 2 ** 16
+
+_Stream = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+_T = TypeVar("_T")
+
+
+class _EventLoop:
+    # The single loop in the daemon thread, shared by all openers
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self) -> asyncio.AbstractEventLoop:
+        with self.__lock:
+            if self.__loop is None:
+                self.__loop = asyncio.new_event_loop()
+                threading.Thread(target=self.__loop.run_forever, name="emonoda-aioopener", daemon=True).start()
+            return self.__loop
+
+
+_EVENT_LOOP = _EventLoop()
+
+
+class _Response:
+    def __init__(self, url: str, code: int, headers: http.client.HTTPMessage, body: bytes) -> None:
+        self.url = url
+        self.code = code
+        self.headers = headers
+        self.__body = body
+
+    def info(self) -> http.client.HTTPMessage:  # For http.cookiejar
+        return self.headers
+
+    def read(self) -> bytes:
+        return self.__body
+
+
+class _Target(NamedTuple):
+    key: Tuple[str, str, int]  # Where to connect: (scheme, host, port)
+    path: str  # What to request
+    proxy_headers: Dict[str, str]
+
+
+# =====
+class AsyncOpener:
+    # The replacement of build_opener() on asyncio: all requests are going through the one event loop
+    # and reuse the keep-alive connections. It's compatible with read_url() and raises the same
+    # exceptions as urllib, so the retries work the same way. Supports cookies, gzip and the proxies.
+    # Like in urllib, the timeout is applied to each connect and read, not to the whole request.
+    # The calling thread is blocked by open() until the response, so the checks still take a thread each,
+    # the win is in the reused connections. Only open_async() can be awaited without a thread.
+
+    def __init__(
+        self,
+        proxy_url: str="",
+        cookie_jar: Optional[http.cookiejar.CookieJar]=None,
+    ) -> None:
+
+        self.__proxy_url = proxy_url
+        self.__proxy_scheme = (urllib.parse.urlparse(proxy_url).scheme or "").lower()
+        if proxy_url and self.__proxy_scheme not in ["http", "https", "socks4", "socks5"]:
+            raise RuntimeError(f"Invalid proxy protocol: {self.__proxy_scheme}")
+        self.__cookie_jar = cookie_jar
+
+        self.__ssl_context = ssl.create_default_context()
+        self.__idle: Dict[Tuple[str, str, int], List[_Stream]] = {}
+
+    def open(self, request: urllib.request.Request, timeout: float=10.0) -> _Response:
+        return asyncio.run_coroutine_threadsafe(self.open_async(request, timeout), _EVENT_LOOP.get()).result()
+
+    async def open_async(self, request: urllib.request.Request, timeout: float=10.0) -> _Response:
+        for _ in range(_MAX_REDIRECTS + 1):
+            response = await self.__open_once(request, timeout)
+            location = response.headers.get("Location", "")
+            if response.code not in [301, 302, 303, 307, 308] or not location:
+                return response
+
+            method = request.get_method()
+            if not (method in ["GET", "HEAD"] or (method == "POST" and response.code in [301, 302, 303])):
+                raise urllib.error.HTTPError(request.full_url, response.code, "Can't redirect", response.headers, None)
+            request = urllib.request.Request(
+                url=urllib.parse.urljoin(request.full_url, location),
+                headers={
+                    key: value
+                    for (key, value) in request.headers.items()
+                    if key.lower() not in ["content-length", "content-type"]
+                },
+                origin_req_host=request.origin_req_host,
+                unverifiable=True,
+            )
+        raise urllib.error.HTTPError(request.full_url, response.code, "Too many redirects", response.headers, None)
+
+    # =====
+
+    async def __open_once(self, request: urllib.request.Request, timeout: float) -> _Response:
+        if self.__cookie_jar is not None:
+            self.__cookie_jar.add_cookie_header(request)
+        target = self.__get_target(request)
+        headers = {
+            "Host": (request.host or ""),
+            "Accept-Encoding": "gzip",
+            **target.proxy_headers,
+            **dict(request.header_items()),
+            "Connection": "keep-alive",
+        }
+        data = request.data
+        if data is not None:
+            assert isinstance(data, bytes), "Only the bytes are supported as a request body"
+            headers.setdefault("Content-type", "application/x-www-form-urlencoded")
+            headers["Content-Length"] = str(len(data))
+        head = "".join(
+            f"{key}: {value}\r\n"
+            for (key, value) in headers.items()
+        )
+        raw = f"{request.get_method()} {target.path} HTTP/1.1\r\n{head}\r\n".encode("iso-8859-1") + (data or b"")
+
+        (code, reason, resp_headers, body) = await self.__exchange(target.key, raw, (request.get_method() == "HEAD"), timeout)
+        if resp_headers.get("Content-Encoding") == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError, zlib.error) as err:
+                raise urllib.error.URLError(err)
+        response = _Response(request.full_url, code, resp_headers, body)
+
+        if self.__cookie_jar is not None:
+            self.__cookie_jar.extract_cookies(response, request)  # type: ignore
+        if code >= 400:
+            raise urllib.error.HTTPError(request.full_url, code, reason, resp_headers, io.BytesIO(body))
+        return response
+
+    def __get_target(self, request: urllib.request.Request) -> _Target:
+        parsed = urllib.parse.urlparse(request.full_url)
+        scheme = parsed.scheme.lower()
+        if scheme not in ["http", "https"]:
+            raise urllib.error.URLError(f"unknown url type: {scheme}")
+        host = (parsed.hostname or "")
+        port = (parsed.port or (443 if scheme == "https" else 80))
+        path = (request.selector or "/")
+
+        if self.__proxy_scheme == "http" and scheme == "http":
+            # Like urllib.request.ProxyHandler: the proxy is used for the same scheme only
+            proxy = urllib.parse.urlparse(self.__proxy_url)
+            return _Target(
+                key=("proxy", (proxy.hostname or ""), (proxy.port or 80)),
+                path=request.full_url,
+                proxy_headers=_get_proxy_auth_headers(proxy),
+            )
+        return _Target((scheme, host, port), path, {})
+
+    # =====
+
+    async def __exchange(
+        self,
+        key: Tuple[str, str, int],
+        raw: bytes,
+        is_head: bool,
+        timeout: float,
+    ) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+
+        while True:
+            (stream, reused) = await self.__get_stream(key, timeout)
+            (reader, writer) = stream
+            try:
+                writer.write(raw)
+                await _wait(writer.drain(), timeout)
+                (code, reason, headers, body, keep_alive) = await _read_response(reader, is_head, timeout)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as err:
+                writer.close()
+                if reused:
+                    continue  # The server has closed the idle connection, let's try a new one
+                if isinstance(err, BrokenPipeError):
+                    raise urllib.error.URLError(err)
+                raise
+            except ssl.SSLError as err:
+                writer.close()
+                raise urllib.error.URLError(err)
+            except BaseException:
+                writer.close()
+                raise
+
+            if keep_alive and len(self.__idle.setdefault(key, [])) < _MAX_IDLE:
+                self.__idle[key].append(stream)
+            else:
+                writer.close()
+            return (code, reason, headers, body)
+
+    async def __get_stream(self, key: Tuple[str, str, int], timeout: float) -> Tuple[_Stream, bool]:
+        idle = self.__idle.get(key, [])
+        while idle:
+            (reader, writer) = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return ((reader, writer), True)
+            writer.close()
+
+        (scheme, host, port) = key
+        try:
+            if scheme == "proxy" or not self.__proxy_url or self.__proxy_scheme not in [scheme, "socks4", "socks5"]:
+                stream = await _wait(asyncio.open_connection(
+                    host=host,
+                    port=port,
+                    ssl=(self.__ssl_context if scheme == "https" else None),
+                    limit=_LINE_LIMIT,
+                ), timeout)
+            else:
+                # The SOCKS handshake and the CONNECT tunnel are made by the blocking socket in the executor,
+                # and the asyncio is taking it after that.
+                loop = asyncio.get_running_loop()
+                sock = await loop.run_in_executor(None, self.__connect_proxied, host, port, timeout)
+                stream = await _wait(asyncio.open_connection(
+                    sock=sock,
+                    ssl=(self.__ssl_context if scheme == "https" else None),
+                    server_hostname=(host if scheme == "https" else None),
+                    limit=_LINE_LIMIT,
+                ), timeout)
+        except socket.timeout:
+            raise
+        except OSError as err:
+            raise urllib.error.URLError(err)
+        return (stream, False)
+
+    def __connect_proxied(self, host: str, port: int, timeout: float) -> socket.socket:
+        sock: socket.socket
+        if self.__proxy_scheme in ["socks4", "socks5"]:
+            sock = socks.socksocket()
+            sock.setproxy(*sockshandler.parse_proxy_url(self.__proxy_url))
+            sock.settimeout(timeout)
+            sock.connect((host, port))
+        else:
+            # HTTPS over the HTTPS proxy, like urllib does it using the tunnel
+            proxy = urllib.parse.urlparse(self.__proxy_url)
+            conn = http.client.HTTPConnection((proxy.hostname or ""), (proxy.port or 443), timeout=timeout)
+            conn.set_tunnel(host, port, _get_proxy_auth_headers(proxy))
+            conn.connect()
+            sock = conn.sock
+        return socket.socket(fileno=sock.detach())  # The plain socket without the proxy wrappers for asyncio
+
+
+# =====
+def _get_proxy_auth_headers(proxy: urllib.parse.ParseResult) -> Dict[str, str]:
+    if proxy.username is None:
+        return {}
+    creds = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(creds.encode()).decode("ascii")}
+
+
+async def _read_response(
+    reader: asyncio.StreamReader,
+    is_head: bool,
+    timeout: float,
+) -> Tuple[int, str, http.client.HTTPMessage, bytes, bool]:
+
+    while True:
+        line = await _wait(reader.readline(), timeout)
+        if not line:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        parts = line.decode("iso-8859-1").rstrip("\r\n").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise http.client.BadStatusLine(line.decode("iso-8859-1"))
+        (version, code, reason) = (parts[0], int(parts[1]), (parts[2] if len(parts) == 3 else ""))
+
+        raw_headers = b""
+        while True:
+            line = await _wait(reader.readline(), timeout)
+            if line in [b"\r\n", b"\n", b""]:
+                break
+            raw_headers += line
+        headers = http.client.parse_headers(io.BytesIO(raw_headers + b"\r\n"))
+        if code != 100:
+            break
+
+    keep_alive = (version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close")
+    if is_head or code in [204, 304] or 100 <= code < 200:
+        body = b""
+    elif headers.get("Transfer-Encoding", "").lower() == "chunked":
+        body = await _read_chunked(reader, timeout)
+    elif headers.get("Content-Length", "").isdigit():
+        body = await _read_exactly(reader, int(headers["Content-Length"]), timeout)
+    else:
+        body = await _read_exactly(reader, None, timeout)
+        keep_alive = False
+    return (code, reason, headers, body, keep_alive)
+
+
+async def _read_chunked(reader: asyncio.StreamReader, timeout: float) -> bytes:
+    chunks: List[bytes] = []
+    while True:
+        line = await _wait(reader.readline(), timeout)
+        try:
+            size = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise http.client.IncompleteRead(b"".join(chunks))
+        if size == 0:
+            break
+        chunks.append(await _read_exactly(reader, size, timeout))
+        await _read_exactly(reader, 2, timeout)  # CRLF
+    while (await _wait(reader.readline(), timeout)) not in [b"\r\n", b"\n", b""]:  # Trailers
+        pass
+    return b"".join(chunks)
+
+
+async def _read_exactly(reader: asyncio.StreamReader, size: Optional[int], timeout: float) -> bytes:
+    # Reads by the pieces, so the timeout is for the each one like for the socket in urllib.
+    # Without the size it's reading until EOF.
+    chunks: List[bytes] = []
+    left = size
+    while left is None or left > 0:
+        chunk = await _wait(reader.read(_READ_SIZE if left is None else min(left, _READ_SIZE)), timeout)
+        if not chunk:
+            if left is None:
+                break
+            raise http.client.IncompleteRead(b"".join(chunks), left)
+        chunks.append(chunk)
+        if left is not None:
+            left -= len(chunk)
+    return b"".join(chunks)
+
+
+async def _wait(aw: Awaitable[_T], timeout: float) -> _T:
+    try:
+        return await asyncio.wait_for(aw, timeout)
+    except asyncio.TimeoutError:
+        raise socket.timeout("timed out")
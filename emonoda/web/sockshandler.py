@@ -45,6 +45,17 @@ SOCKS_PORT = 1080
 
 
 # =====
+def parse_proxy_url(proxy_url: str) -> Tuple[int, Optional[str], int, bool, Optional[str], Optional[str]]:
+    parsed = urllib.parse.urlparse(proxy_url)
+    scheme = parsed.scheme
+    proxy_type = SCHEME_TO_TYPE.get((scheme or "").lower())
+    if proxy_type is None:
+        raise RuntimeError(f"Invalid SOCKS protocol: {scheme}")
+    params = dict(urllib.parse.parse_qsl(parsed.query))
+    rdns = (str(params.get("rdns")) in ["1", "yes", "true"])
+    return (proxy_type, parsed.hostname, (parsed.port or SOCKS_PORT), rdns, parsed.username, parsed.password)
+
+
 class _SocksConnection(HTTPConnection):
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         kwargs.pop("proxy_url", None)  # XXX: Fix for "TypeError: __init__() got an unexpected keyword argument 'proxy_url'"
@@ -71,18 +82,7 @@ class _SocksConnection(HTTPConnection):
     ) -> None:
 
         if proxy_url:
-            parsed = urllib.parse.urlparse(proxy_url)
-            scheme = parsed.scheme
-            proxy_user = parsed.username
-            proxy_passwd = parsed.password
-            proxy_host = parsed.hostname
-            proxy_port = (parsed.port or SOCKS_PORT)
-            proxy_type = SCHEME_TO_TYPE.get((scheme or "").lower())
-            if proxy_type is None:
-                raise RuntimeError(f"Invalid SOCKS protocol: {scheme}")
-            params = dict(urllib.parse.parse_qsl(parsed.query))
-            if str(params.get("rdns")) not in ["1", "yes", "true"]:
-                rdns = False
+            (proxy_type, proxy_host, proxy_port, rdns, proxy_user, proxy_passwd) = parse_proxy_url(proxy_url)
 
         self.__proxy_args = (proxy_type, proxy_host, proxy_port, rdns, proxy_user, proxy_passwd)
 
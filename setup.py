@@ -97,11 +97,14 @@ def main() -> None:
                 "emload = emonoda.apps.emload:main",
                 "emfind = emonoda.apps.emfind:main",
                 "emrm = emonoda.apps.emrm:main",
+                "emverify = emonoda.apps.emverify:main",
                 "emconfetti-demo = emonoda.apps.emconfetti_demo:main",
                 "emconfetti-tghi = emonoda.apps.emconfetti_tghi:main",
                 "emhook-rtorrent-collectd-stat = emonoda.apps.hooks.rtorrent.collectd_stat:main",
                 "emhook-rtorrent-manage-trackers = emonoda.apps.hooks.rtorrent.manage_trackers:main",
+                "emhook-rtorrent-update-cache = emonoda.apps.hooks.rtorrent.update_cache:main",
                 "emhook-transmission-redownload = emonoda.apps.hooks.transmission.redownload:main",
+                "emhook-transmission-update-cache = emonoda.apps.hooks.transmission.update_cache:main",
             ],
         },
 